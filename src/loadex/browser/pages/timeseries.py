@@ -127,6 +127,7 @@ layout = dbc.Container([
                         type='default',
                         children=dcc.Graph(id='timeseries-plot')
                     ),
+                    dcc.Store(id='timeseries-time-range', data=None),
                     html.Div(id='timeseries-selection-summary', className='text-muted mt-2')
                 ])
             ])
@@ -178,16 +179,36 @@ def initialize_timeseries_page(metadata, session_id):
     )
 
 
+@callback(
+    Output('timeseries-time-range', 'data'),
+    Input('timeseries-plot', 'relayoutData'),
+    prevent_initial_call=True
+)
+def update_time_range(relayout_data):
+    """Store the visible time range when the user zooms or pans, or None when the axes are reset."""
+    if not relayout_data:
+        return dash.no_update
+
+    if relayout_data.get('xaxis.autorange'):
+        return None
+    if 'xaxis.range[0]' in relayout_data and 'xaxis.range[1]' in relayout_data:
+        return [float(relayout_data['xaxis.range[0]']), float(relayout_data['xaxis.range[1]'])]
+    if 'xaxis.range' in relayout_data:
+        return [float(value) for value in relayout_data['xaxis.range']]
+    return dash.no_update
+
+
 @callback(
     [Output('timeseries-plot', 'figure'),
      Output('timeseries-selection-summary', 'children')],
     [Input('timeseries-file-dropdown', 'value'),
      Input('timeseries-sensor-dropdown', 'value'),
-     Input('timeseries-subplots-toggle', 'value')],
+     Input('timeseries-subplots-toggle', 'value'),
+     Input('timeseries-time-range', 'data')],
     State('session-id-store', 'data'),
     prevent_initial_call=False
 )
-def update_timeseries_plot(selected_files, selected_sensors, subplot_toggle, session_id):
+def update_timeseries_plot(selected_files, selected_sensors, subplot_toggle, time_range, session_id):
     fig = go.Figure()
 
     if session_id is None:
@@ -312,6 +333,7 @@ def update_timeseries_plot(selected_files, selected_sensors, subplot_toggle, ses
                     showlegend=(row_index == 1),
                     xaxis_id='x',
                     yaxis_id=trace_yaxis,
+                    time_range=time_range,
                 )
             else:
                 fig = file.plot_timeseries(
@@ -319,6 +341,7 @@ def update_timeseries_plot(selected_files, selected_sensors, subplot_toggle, ses
                     axis=fig,
                     label=overlay_label,
                     engine='plotly',
+                    time_range=time_range,
                 )
             trace_count += 1
 
@@ -348,4 +371,9 @@ def update_timeseries_plot(selected_files, selected_sensors, subplot_toggle, ses
 
     # Draw an x-position guide while hovering.
     fig.update_xaxes(showspikes=True, spikemode='across', spikesnap='cursor', spikethickness=1)
+
+    # Only the visible window is read when zoomed in; keep the zoom while the traces are replaced.
+    fig.update_layout(uirevision='timeseries')
+    if time_range:
+        fig.update_xaxes(range=time_range)
     return fig, f"{trace_count} traces selected"
\ No newline at end of file
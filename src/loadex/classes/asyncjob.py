@@ -0,0 +1,51 @@
+import asyncio
+import copy
+import functools
+
+
+_DONE = object()
+
+
+class AsyncJob(object):
+    """A blocking call with a progress_callback run in a thread, for use from an asyncio event loop
+
+    Await the job for the return value of the call, and iterate over it with async for to receive a copy of
+    each Progress passed to the callback as it happens, e.g.
+
+        job = dataset.generate_statistics_async(parallel=True)
+        async for progress in job:
+            print(progress)
+        failed = await job
+
+    The progress events can only be iterated over once. A progress_callback passed to the job is still called,
+    from the thread. Must be created from a running event loop.
+    """
+
+    def __init__(self, function, *args, **kwargs):
+        self._loop = asyncio.get_running_loop()
+        self._events = asyncio.Queue()
+        self._progress_callback = kwargs.get("progress_callback")
+        kwargs["progress_callback"] = self._callback
+        self._future = self._loop.run_in_executor(None, functools.partial(function, *args, **kwargs))
+        # queued after all progress events, which are put on the loop before the call returns
+        self._future.add_done_callback(lambda future: self._events.put_nowait(_DONE))
+
+    def _callback(self, progress):
+        if self._progress_callback is not None:
+            self._progress_callback(progress)
+        self._loop.call_soon_threadsafe(self._events.put_nowait, copy.copy(progress))
+
+    def done(self) -> bool:
+        return self._future.done()
+
+    def __await__(self):
+        return self._future.__await__()
+
+    async def __aiter__(self):
+        while True:
+            event = await self._events.get()
+            if event is _DONE:
+                break
+            yield event
+        # raise any exception of the call
+        await self._future
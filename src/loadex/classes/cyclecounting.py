@@ -0,0 +1,214 @@
+"""Rainflow cycle counting (ASTM E1049-85, section 5.4.4) with selectable backends.
+
+The "numpy" backend finds turning points with array operations and counts the cycles of all
+columns of a (time x sensors) block together. The "rainflow" backend delegates to the rainflow
+package. Both return the cycles of a series as an array with columns (range, mean, count). The
+numpy backend finds the same cycles as the package, but not necessarily in the same order.
+"""
+import os
+
+import numpy as np
+import rainflow
+
+backends = ["numpy", "rainflow"]
+default_backend = "numpy"
+ENVIRONMENT_VARIABLE = "LOADEX_CYCLE_COUNTING_BACKEND"
+
+
+def set_backend(backend: str):
+    """Set the cycle counting backend used when none is given, including in worker processes started afterwards"""
+    os.environ[ENVIRONMENT_VARIABLE] = _check_backend(backend)
+
+
+def get_backend() -> str:
+    """Return the cycle counting backend used when none is given"""
+    return os.environ.get(ENVIRONMENT_VARIABLE) or default_backend
+
+
+def _check_backend(backend: str = None) -> str:
+    if backend is None:
+        backend = get_backend()
+    if backend not in backends:
+        raise ValueError(f"Invalid cycle counting backend '{backend}'. Must be one of {backends}.")
+    return backend
+
+
+def reversals(x) -> tuple[np.ndarray, np.ndarray]:
+    """Return the indices and values of the reversal points of a series
+
+    Follows rainflow.reversals: the first and last points are treated as reversals and a
+    plateau is reported at its last index.
+    """
+    x = np.asarray(x, dtype=float)
+    n = len(x)
+    if n < 2:
+        return np.empty(0, dtype=np.intp), np.empty(0)
+    if n == 2:
+        return np.array([0]), x[:1]
+
+    # drop repeated values after the second point, the series then changes at every step
+    keep = np.empty(n - 1, dtype=bool)
+    keep[0] = True
+    keep[1:] = x[2:] != x[1:-1]
+    position = np.flatnonzero(keep) + 1
+    values = x[position]
+
+    slope = np.diff(values)
+    slope_before = np.concatenate(([x[1] - x[0]], slope[:-1]))
+    turning = np.flatnonzero(slope_before * slope < 0)
+
+    indices = np.concatenate(([0], position[turning + 1] - 1, [n - 1]))
+    values = np.concatenate((x[:1], values[turning], x[-1:]))
+    return indices, values
+
+
+def _close_cycles(values: np.ndarray, column: np.ndarray) -> tuple[list, np.ndarray, np.ndarray]:
+    """Extract the full cycles from the concatenated reversals of several columns
+
+    Instead of stepping through the reversals with a stack, every range that the three-point
+    algorithm would close as a full cycle is extracted at once: a range that is smaller than the
+    range before it and not larger than the range after it. Removing those points exposes the next
+    level of cycles, so passes repeat until none are left. This gives the same cycles as the
+    sequential algorithm in fewer, larger array operations.
+
+    Returns the cycles found as (column, x1, x2, count) parts and the remaining residue.
+    """
+    found = []
+    while True:
+        ranges = np.abs(np.diff(values))
+        same_column = column[1:] == column[:-1]
+
+        closed = np.zeros(len(ranges), dtype=bool)
+        if len(ranges) >= 3:
+            # written as "not X < Y" where the sequential algorithm counts, so NaN behaves the same
+            closed[1:-1] = (
+                same_column[:-2] & same_column[1:-1] & same_column[2:]
+                & (ranges[1:-1] < ranges[:-2]) & ~(ranges[2:] < ranges[1:-1])
+            )
+        j = np.flatnonzero(closed)
+        if not j.size:
+            return found, values, column
+
+        found.append((column[j], values[j], values[j + 1], np.ones(len(j))))
+        keep = np.ones(len(values), dtype=bool)
+        keep[j] = False
+        keep[j + 1] = False
+        values = values[keep]
+        column = column[keep]
+
+
+def _residue_cycles(values: np.ndarray, column: np.ndarray) -> tuple:
+    """Count the ranges of the residue as half cycles"""
+    j = np.flatnonzero(column[1:] == column[:-1])
+    return column[j], values[j], values[j + 1], np.full(len(j), 0.5)
+
+
+def _split_cycles(found: list, n_columns: int) -> list[np.ndarray]:
+    """Return the (column, x1, x2, count) parts as one (range, mean, count) array per column"""
+    column, x1, x2, count = (np.concatenate(part) for part in zip(*found))
+    order = np.argsort(column, kind="stable")
+    x1, x2 = x1[order], x2[order]
+    cycles = np.column_stack((np.abs(x1 - x2), 0.5 * (x1 + x2), count[order]))
+    return np.split(cycles, np.cumsum(np.bincount(column, minlength=n_columns))[:-1])
+
+
+def _count_reversals(values: np.ndarray, column: np.ndarray, n_columns: int) -> list[np.ndarray]:
+    """Rainflow count of the concatenated reversals of several columns"""
+    found, values, column = _close_cycles(values, column)
+    found.append(_residue_cycles(values, column))
+    return _split_cycles(found, n_columns)
+
+
+def extract_cycles(x, backend: str = None) -> np.ndarray:
+    """Return the rainflow cycles of a series as an array with columns (range, mean, count)"""
+    backend = _check_backend(backend)
+    if backend == "rainflow":
+        cycles = [cycle[0:3] for cycle in rainflow.extract_cycles(x)]
+        return np.array(cycles, dtype=float).reshape(-1, 3)
+
+    _, values = reversals(x)
+    return _count_reversals(values, np.zeros(len(values), dtype=np.intp), 1)[0]
+
+
+def extract_cycles_batch(block: np.ndarray, backend: str = None) -> list[np.ndarray]:
+    """Return the rainflow cycles of each column of a (time x sensors) block"""
+    backend = _check_backend(backend)
+    block = np.asarray(block, dtype=float)
+    if backend == "rainflow":
+        return [extract_cycles(block[:, j], backend) for j in range(block.shape[1])]
+
+    column_reversals = [reversals(block[:, j])[1] for j in range(block.shape[1])]
+    column = np.repeat(np.arange(block.shape[1]), [len(values) for values in column_reversals])
+    return _count_reversals(np.concatenate([np.empty(0)] + column_reversals), column, block.shape[1])
+
+
+class StreamingCycleCounter(object):
+    """Rainflow count of the columns of a (time x sensors) block that is read in time chunks
+
+    The last two distinct values of each column are carried between chunks to find the reversals
+    at the chunk boundaries, and the residue of uncounted reversals is carried until finalize
+    counts it as half cycles. The cycles are the same as extract_cycles_batch of the whole block.
+    """
+
+    def __init__(self, n_columns: int):
+        self.n_columns = n_columns
+        self._head = np.empty((0, n_columns))
+        self._carry = None
+        self._residue_values = np.empty(0)
+        self._residue_column = np.empty(0, dtype=np.intp)
+        self._found = []
+
+    def update(self, chunk: np.ndarray):
+        """Count the cycles closed by the next chunk of samples"""
+        chunk = np.asarray(chunk, dtype=float)
+        if self._carry is None:
+            # the first reversals need at least three samples
+            self._head = np.concatenate((self._head, chunk))
+            if len(self._head) < 3:
+                return
+            chunk, self._head = self._head, None
+
+        column_reversals = []
+        carry = np.empty((2, self.n_columns))
+        for j in range(self.n_columns):
+            if self._carry is None:
+                y = chunk[:, j]
+                # the first point is a reversal, the last is pending until the next chunk
+                points = reversals(y)[1][:-1]
+            else:
+                y = np.concatenate((self._carry[:, j], chunk[:, j]))
+                points = reversals(y)[1][1:-1]
+            column_reversals.append(points)
+
+            # last two distinct values, their slope decides if the last value is a reversal
+            changes = np.flatnonzero(y[2:] != y[1:-1])
+            if changes.size:
+                carry[:, j] = y[changes[-1] + 1:changes[-1] + 3]
+            else:
+                carry[:, j] = y[:2]
+        self._carry = carry
+
+        self._count(column_reversals)
+
+    def _count(self, column_reversals: list[np.ndarray]):
+        column = np.repeat(np.arange(self.n_columns), [len(values) for values in column_reversals])
+        values = np.concatenate([np.empty(0)] + column_reversals)
+
+        # append the new reversals to the residue of each column
+        column = np.concatenate((self._residue_column, column))
+        values = np.concatenate((self._residue_values, values))
+        order = np.argsort(column, kind="stable")
+
+        found, self._residue_values, self._residue_column = _close_cycles(values[order], column[order])
+        self._found += found
+
+    def finalize(self) -> list[np.ndarray]:
+        """Return the cycles of each column, counting the residue as half cycles"""
+        if self._carry is None:
+            # fewer than three samples in total
+            return extract_cycles_batch(self._head)
+
+        # the last value of each column is a reversal
+        self._count([self._carry[1:, j] for j in range(self.n_columns)])
+        found = self._found + [_residue_cycles(self._residue_values, self._residue_column)]
+        return _split_cycles(found, self.n_columns)
@@ -1,4 +1,3 @@
-import multiprocessing
 import shutil
 import tempfile
 from pathlib import Path
@@ -7,20 +6,86 @@ import plotly.graph_objects as go
 import plotly.express as px
 
 import matplotlib.pyplot as plt
+import numpy as np
 import pandas as pd
 
 from loadex.classes.designloadcases import DesignLoadCase, DesignLoadCaseList
 from loadex.classes.filelist import File, FileList
 from loadex.classes.sensorlist import Sensor, SensorList
 from loadex.classes.statistics import Statistic, EquivalentLoad
+from loadex.classes.progress import Progress
+from loadex.classes.asyncjob import AsyncJob
+from loadex.classes import executors
 from loadex.formats.bladed_out_file import BladedOutFile
 from loadex.data.database import get_sqlite_session
 from loadex.data import datamodel
 
 
+class _StatisticsBuffer(object):
+    """Collects the statistics of finished files as rows per sensor and inserts them every batch_size rows
+
+    A row is the statistics of one sensor in one file. Inserting extends the frame of each sensor, which copies it,
+    so the rows are inserted with one concat per sensor and flush rather than for every file.
+    """
+
+    def __init__(self, sensorlist: "SensorList", batch_size: int):
+        self.sensorlist=sensorlist
+        self.batch_size=batch_size
+        self._clear()
+
+    def _clear(self):
+        self.filepaths=[]
+        self.columns={}
+        self.rows={sensor.name: [] for sensor in self.sensorlist}
+        self.n_rows=0
+
+    def add(self, filepath: str, file_stats: dict):
+        # rows with other statistics than the rows collected so far start a new frame
+        if self.filepaths and any(tuple(file_stats[name])!=columns for name, columns in self.columns.items()):
+            self.flush()
+        self.filepaths.append(filepath)
+        for sensor in self.sensorlist:
+            stats=file_stats[sensor.name]
+            self.columns.setdefault(sensor.name,tuple(stats))
+            self.rows[sensor.name].append(tuple(stats.values()))
+        self.n_rows+=len(self.sensorlist)
+        if self.n_rows>=self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.filepaths:
+            return
+        index=pd.Index(self.filepaths)
+        for sensor in self.sensorlist:
+            sensor._insert_generated_statistics(pd.DataFrame(self.rows[sensor.name],index=index,columns=list(self.columns[sensor.name])))
+        self._clear()
+
+
+class _MarkovBuffer(object):
+    """Collects the Markov tables of finished files and inserts them every batch_size rows, see _StatisticsBuffer"""
+
+    def __init__(self, insert, batch_size: int):
+        self.insert=insert
+        self.batch_size=batch_size
+        self.tables=[]
+        self.n_rows=0
+
+    def add(self, markov: pd.DataFrame):
+        self.tables.append(markov)
+        self.n_rows+=len(markov)
+        if self.n_rows>=self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if self.tables:
+            self.insert(self.tables)
+            self.tables=[]
+            self.n_rows=0
+
 
 class DataSet(object):
     """Contains a loads dataset"""
+
     
     def __init__(self, name: str):
         self.name = name
@@ -28,6 +93,7 @@ class DataSet(object):
         self.sensorlist = []
         self.dlcs = DesignLoadCaseList([])
         self.timecolumn = 'time'
+        self.schedule = None
 
     def find_files(self, directories: str |list[str],format, pattern: str=None):
         """Find files in a directory matching a pattern and add them to the filelist"""
@@ -141,116 +207,241 @@ class DataSet(object):
         sensorlist = [Sensor(name,metadata=self.filelist[fileindex].get_sensor_metadata(name)) for name in self.filelist[fileindex].sensor_names]
         self.sensorlist= SensorList(sensorlist)
 
-    def generate_statistics(self,filelist:"FileList"=None,parallel:bool=False,processes:int=8):
-        """Generate statistics for each sensor across all files"""
+    def _iter_process_files(self,files_to_process:"FileList",task:str,args:tuple,parallel:bool=False,processes:int=None,kwargs:dict=None,executor=None,**executor_options):
+        """Call File.<task>(*args,**kwargs) for each file on an executor
+
+        Yields (file, success, output without the success flag, seconds, failure) in the order the files finish, where
+        failure is an executors.FileFailure for failed files. executor is a name in executors.executors, an Executor
+        or a concurrent.futures.Executor, it defaults to "process" if parallel else "serial". processes sets the
+        number of workers, by default the CPUs available to this process. executor_options (timeout, retries,
+        max_tasks_per_child) configure the "process" executor.
+        """
+        kwargs=kwargs or {}
+        if executor is None:
+            executor="process" if parallel else "serial"
+        executor=executors.get_executor(executor,processes,**executor_options)
+
+        for index, (success, *output), metadata, seconds, failure in executor.map_files(files_to_process,task,args,kwargs):
+            file=files_to_process[index]
+            file.metadata=metadata
+            if not success and failure is None:
+                failure=executors.FileFailure(str(file.filepath),"failed")
+            if not isinstance(executor,executors.SerialExecutor):
+                if not success:
+                    print(f"failed to load file: {failure}")
+                else:
+                    print(f"finished loading file: {file.filepath}")
+            yield file, success, output, seconds, failure
+
+    def _process_files(self,files_to_process:"FileList",task:str,args:tuple,insert,parallel:bool=False,processes:int=None,kwargs:dict=None,progress_callback=None,executor=None,
+                       order_by_cost:bool=None,**executor_options)->list:
+        """Run a task on each file and insert the outputs as they finish
+
+        insert is called with the filepath and the output, without the success flag, of each successful file as
+        it finishes, so results are not all held until the end. progress_callback is called
+        with a Progress after each file. order_by_cost submits the files with the largest File.estimated_cost
+        first, by default unless the executor is serial, prints the order before the files are submitted
+        and stores it with the actual seconds of each file in self.schedule.
+        Returns an executors.FileFailure for each failed file.
+        """
+        if executor is None:
+            executor="process" if parallel else "serial"
+        executor=executors.get_executor(executor,processes,**executor_options)
+        if order_by_cost is None:
+            order_by_cost=not isinstance(executor,executors.SerialExecutor)
+
+        schedule=None
+        if order_by_cost:
+            costs={}
+            for file_type in {type(file) for file in files_to_process}:
+                files=[file for file in files_to_process if type(file) is file_type]
+                costs.update(zip([str(file.filepath) for file in files],file_type.estimated_costs(files)))
+            files_to_process=FileList(sorted(files_to_process,key=lambda file: costs[str(file.filepath)],reverse=True))
+            schedule=self._schedule_report(files_to_process.filepaths,costs)
+            self._print_schedule(schedule,"Submitting files largest estimated cost first")
+
+        progress=Progress(total=len(files_to_process))
+        failed=[]
+        durations={}
+        for file, success, output, seconds, failure in self._iter_process_files(files_to_process,task,args,kwargs=kwargs,executor=executor):
+            filepath=str(file.filepath)
+            durations[filepath]=seconds
+            if success:
+                insert(filepath,output)
+            else:
+                failed.append(failure)
+
+            progress.update(filepath,success)
+            if progress_callback is not None:
+                progress_callback(progress)
+
+        if schedule is not None:
+            self.schedule=self._add_durations(schedule,durations)
+            self._print_schedule(self.schedule,"Fitted vs actual seconds")
+        return failed
+
+    @staticmethod
+    def _schedule_report(filepaths:list[str],costs:dict)->pd.DataFrame:
+        """Return the submission order and estimated cost of each file"""
+        return pd.DataFrame({
+            "order":range(len(filepaths)),
+            "estimated_cost":[costs[filepath] for filepath in filepaths],
+        },index=pd.Index(filepaths,name="filepath"))
+
+    @staticmethod
+    def _add_durations(schedule:pd.DataFrame,durations:dict)->pd.DataFrame:
+        """Add the actual seconds of each file, and the fitted seconds of its estimated cost
+
+        The fitted seconds are the costs scaled by the seconds per unit cost of the timed files of the same run, so
+        they show how well the cost ranks the files rather than predict the run.
+        """
+        schedule=schedule.copy()
+        schedule["actual_seconds"]=pd.Series([durations.get(filepath) for filepath in schedule.index],index=schedule.index,dtype=float)
+
+        timed=schedule["actual_seconds"].notna()
+        total_cost=schedule.loc[timed,"estimated_cost"].sum()
+        rate=schedule.loc[timed,"actual_seconds"].sum()/total_cost if total_cost>0 else np.nan
+        schedule.insert(2,"fitted_seconds",schedule["estimated_cost"]*rate)
+        return schedule
+
+    @staticmethod
+    def _print_schedule(schedule:pd.DataFrame,title:str,n:int=10):
+        if schedule.empty:
+            return
+        print(f"{title}, first {min(n,len(schedule))} of {len(schedule)} files:")
+        print(schedule.head(n).to_string())
+
+    def _insert_markov(self,sensorlist:"SensorList",cached_data:list[pd.DataFrame]):
+        """Insert Markov cycle tables into the sensors"""
+        df=pd.concat(cached_data, ignore_index=True)
+        df=df.set_index("filepath")
+        
+        print(f"Inserting Markov data for {len(sensorlist)} sensors")
+        markovgroupedbysensor=df.groupby("sensor")
+        for sensor in sensorlist:
+            sensor._insert_generated_markov(markovgroupedbysensor.get_group(sensor.name).drop(columns=["sensor"]))
+
+    @staticmethod
+    def _print_failed(failed:list):
+        if failed:
+            print("failed to load:")
+            for f in failed:
+                print(f)
+
+    def generate_statistics(self,filelist:"FileList"=None,parallel:bool=False,processes:int=None,chunk_size:int=None,progress_callback=None,batch_size:int=100000,executor=None,timeout:float=None,retries:int=None,max_tasks_per_child:int=None,
+                            sensor_workers:int=None,sensor_executor:str=None,order_by_cost:bool=None)->list:
+        """Generate statistics for each sensor across all files
+
+        chunk_size reads the timeseries in chunks of that many samples, see File.generate_statistics.
+        Results are collected as the files finish and inserted into the sensors batch_size rows (files x sensors)
+        at a time, which bounds the results held besides the sensor frames. progress_callback is called with a Progress (files/s, ETA) after each
+        file, e.g. print_progress.
+        executor selects the backend: "serial", "thread", "process" (the default if parallel), an executors.Executor
+        or a concurrent.futures.Executor. processes defaults to the CPUs available to this process.
+        timeout (seconds per file), retries (of files that time out or crash their worker) and max_tasks_per_child
+        (files per worker before it is replaced) configure the "process" executor, see executors.ProcessExecutor.
+        sensor_workers also spreads the sensors of each file over a "thread" or "process" sensor_executor (by
+        default the one of the file format), e.g. for a single large file, see File.generate_statistics. order_by_cost submits the files with the largest
+        File.estimated_cost first, by default unless the executor is serial, and stores the submission order and
+        estimated cost with the actual and fitted seconds per file in self.schedule. Returns an executors.FileFailure for each file
+        that failed.
+        """
         if not self.filelist:
             raise ValueError("Filelist is empty. Please find files first.")
         if not self.sensorlist:
             raise ValueError("Sensorlist is empty. Please set sensors first.")
         
-        failed=[]
-        
         if filelist is not None:
             files_to_process=filelist
         else:
             files_to_process=self.filelist
 
-        cached_data={}
-        if parallel==False:
-            for file in files_to_process:
-            
-                success, file_stats = file.generate_statistics(self.sensorlist)
-                if not success:
-                    failed.append(file.filepath)
-                    continue
-                else:
-                    cached_data[str(file.filepath)]=file_stats
-        else:
-            with multiprocessing.Pool(processes=processes) as pool:
-                results = []
-                for file in files_to_process:
-                    print(f"adding file to queue: {file.filepath}")
-                    file.clear_connections()
-                    result = pool.apply_async(file.generate_statistics, args=(self.sensorlist,))
-                    results.append((str(file.filepath), result))
-                
-                for filepath, result in results:
-                    success, file_stats = result.get()
-                    if not success:
-                        print(f"failed to load file: {filepath}")
-                        failed.append(filepath)
-                        continue
-                    else:
-                        print(f"finished loading file: {filepath}")
-                        cached_data[filepath]=file_stats
+        statistics=_StatisticsBuffer(self.sensorlist,batch_size)
+        def insert(filepath,output):
+            statistics.add(filepath,output[0])
 
-        # Now populate sensor data from cached_data
-        cached_data=pd.DataFrame.from_dict(cached_data, orient='index')
-        
-        cached_data.index.name="filename"
-        for sensor in self.sensorlist:
-            sensor_data=pd.DataFrame(cached_data[sensor.name].values.tolist(),index=cached_data.index)
-            sensor._insert_generated_statistics(sensor_data)
-            
-        if failed:
-            print("failed to load:")
-            for f in failed:
-                print(f)
+        failed = self._process_files(files_to_process,"generate_statistics",(self.sensorlist,),insert,parallel=parallel,processes=processes,
+                                     kwargs={"chunk_size":chunk_size,"sensor_workers":sensor_workers,"sensor_executor":sensor_executor},progress_callback=progress_callback,executor=executor,
+                                     timeout=timeout,retries=retries,max_tasks_per_child=max_tasks_per_child,order_by_cost=order_by_cost)
+        statistics.flush()
+        self._print_failed(failed)
+        return failed
 
-    def generate_markov(self,sensorlist:"SensorList",filelist:"FileList"=None,parallel:bool=False,processes:int=8,write_to_file:bool=True):
-        """Generate statistics for each sensor across all files"""
+    def generate_markov(self,sensorlist:"SensorList",filelist:"FileList"=None,parallel:bool=False,processes:int=None,write_to_file:bool=True,progress_callback=None,batch_size:int=100000,executor=None,timeout:float=None,retries:int=None,max_tasks_per_child:int=None,
+                        order_by_cost:bool=None)->list:
+        """Generate statistics for each sensor across all files
+
+        See generate_statistics for progress_callback, batch_size, the executor options, order_by_cost and the
+        returned failures.
+        """
     
-        
-        failed=[]
-        
         if filelist is not None:
             files_to_process=filelist
         else:
             files_to_process=self.filelist
 
-        cached_data=[]
-        if parallel==False:
-            for file in files_to_process:
-            
-                success, markov = file.generate_markov(sensorlist,write_to_file=write_to_file)
-                if not success:
-                    failed.append(file.filepath)
-                    continue
-                else:
-                    cached_data.append(markov)
+        markovs=_MarkovBuffer(lambda tables: self._insert_markov(sensorlist,tables),batch_size)
+        def insert(filepath,output):
+            markovs.add(output[0])
+
+        failed = self._process_files(files_to_process,"generate_markov",(sensorlist,write_to_file),insert,parallel=parallel,processes=processes,
+                                     progress_callback=progress_callback,executor=executor,
+                                     timeout=timeout,retries=retries,max_tasks_per_child=max_tasks_per_child,order_by_cost=order_by_cost)
+        markovs.flush()
+        self._print_failed(failed)
+        return failed
+
+    def ingest(self,markov_sensorlist:"SensorList"=None,filelist:"FileList"=None,parallel:bool=False,processes:int=None,write_to_file:bool=True,chunk_size:int=None,progress_callback=None,batch_size:int=100000,executor=None,timeout:float=None,retries:int=None,max_tasks_per_child:int=None,
+               sensor_workers:int=None,sensor_executor:str=None,order_by_cost:bool=None)->list:
+        """Generate statistics and Markov cycles for each sensor across all files in one pass over the data
+
+        Each file is opened once and each sensor read once, instead of once by generate_statistics and again by
+        generate_markov. markov_sensorlist defaults to the sensors with a statistic that uses rainflow cycles.
+        chunk_size reads the timeseries in chunks of that many samples, see File.generate_statistics.
+        See generate_statistics for progress_callback, batch_size, the executor options, sensor_workers,
+        order_by_cost and the returned failures.
+        """
+        if not self.filelist:
+            raise ValueError("Filelist is empty. Please find files first.")
+        if not self.sensorlist:
+            raise ValueError("Sensorlist is empty. Please set sensors first.")
+
+        if filelist is not None:
+            files_to_process=filelist
         else:
-            with multiprocessing.Pool(processes=processes) as pool:
-                results = []
-                for file in files_to_process:
-                    print(f"adding file to queue: {file.filepath}")
-                    file.clear_connections()
-                    result = pool.apply_async(file.generate_markov, args=(sensorlist,write_to_file))
-                    results.append((str(file.filepath), result))
-                
-                for filepath, result in results:
-                    success, markov = result.get()
-                    if not success:
-                        print(f"failed to load file: {filepath}")
-                        failed.append(filepath)
-                        continue
-                    else:
-                        print(f"finished loading file: {filepath}")
-                        cached_data.append(markov)
+            files_to_process=self.filelist
 
-        # Now populate sensor data from cached_data
-        df=pd.concat(cached_data, ignore_index=True)
-        df=df.set_index("filepath")
-        
-        markovgroupedbysensor=df.groupby("sensor")
-        for sensor in sensorlist:
-            print(f"Inserting Markov data for sensor: {sensor.name}")
-            sensor._insert_generated_markov(markovgroupedbysensor.get_group(sensor.name).drop(columns=["sensor"]))
-            
-        if failed:
-            print("failed to load:")
-            for f in failed:
-                print(f)
+        if markov_sensorlist is None:
+            markov_sensorlist=self.sensorlist.get_sensors(has_cycle_statistic=True)
+
+        statistics=_StatisticsBuffer(self.sensorlist,batch_size)
+        markovs=_MarkovBuffer(lambda tables: self._insert_markov(markov_sensorlist,tables),batch_size)
+        def insert(filepath,output):
+            file_stats, markov=output
+            statistics.add(filepath,file_stats)
+            if markov is not None:
+                markovs.add(markov)
+
+        failed = self._process_files(files_to_process,"ingest",(self.sensorlist,markov_sensorlist,write_to_file),insert,parallel=parallel,processes=processes,
+                                     kwargs={"chunk_size":chunk_size,"sensor_workers":sensor_workers,"sensor_executor":sensor_executor},progress_callback=progress_callback,executor=executor,
+                                     timeout=timeout,retries=retries,max_tasks_per_child=max_tasks_per_child,order_by_cost=order_by_cost)
+        statistics.flush()
+        markovs.flush()
+        self._print_failed(failed)
+        return failed
     
+    def generate_statistics_async(self,*args,**kwargs)->AsyncJob:
+        """Run generate_statistics in a thread from an event loop, await the job for the failures and iterate over it for progress"""
+        return AsyncJob(self.generate_statistics,*args,**kwargs)
+
+    def generate_markov_async(self,*args,**kwargs)->AsyncJob:
+        """Run generate_markov in a thread from an event loop, see generate_statistics_async"""
+        return AsyncJob(self.generate_markov,*args,**kwargs)
+
+    def ingest_async(self,*args,**kwargs)->AsyncJob:
+        """Run ingest in a thread from an event loop, see generate_statistics_async"""
+        return AsyncJob(self.ingest,*args,**kwargs)
+
     def load_markov(self,sensorlist:"SensorList",filelist:"FileList"=None):
         """load previously generated markov matrices for each sensor across all files"""
         
@@ -275,18 +466,8 @@ class DataSet(object):
             cached_data.append(markov)
 
         # Now populate sensor data from cached_data
-        df=pd.concat(cached_data, ignore_index=True)
-        df=df.set_index("filepath")
-        
-        markovgroupedbysensor=df.groupby("sensor")
-        for sensor in sensorlist:
-            print(f"Inserting Markov data for sensor: {sensor.name}")
-            sensor._insert_generated_markov(markovgroupedbysensor.get_group(sensor.name).drop(columns=["sensor"]))
-            
-        if failed:
-            print("failed to load:")
-            for f in failed:
-                print(f)
+        self._insert_markov(sensorlist,cached_data)
+        self._print_failed(failed)
 
     def to_sql(self, database_file:str):
         """Save the dataset to a SQLite database"""
@@ -305,11 +486,19 @@ class DataSet(object):
             
             # Commit once at the end
             session.commit()
+            engine = session.get_bind()
+
+        # Dispose of all connections in the pool to release file locks
+        engine.dispose()
         print(f"Finished writing dataset '{self.name}' to database")
 
     @staticmethod
-    def from_sql(database_file:str, name:str=None,copy_to_temp=False)->"DataSet":
-        """Read the dataset from a SQLite database"""
+    def from_sql(database_file:str, name:str=None,copy_to_temp=False,progress_callback=None)->"DataSet":
+        """Read the dataset from a SQLite database
+
+        progress_callback is called with a Progress over the three steps (designloadcases, files, sensors),
+        with the name of the step as filepath.
+        """
         if not name:
             name=Path(database_file).stem
         
@@ -323,16 +512,25 @@ class DataSet(object):
 
         print(f"Loading dataset '{name}' from database: {database_file}")
         ds=DataSet(name=name)
+        progress=Progress(total=3)
+        def step(step_name):
+            progress.update(step_name,True)
+            if progress_callback is not None:
+                progress_callback(progress)
+
         Session=get_sqlite_session(database_file,create_if_not_exists=False)  # Ensure DB and tables are created
         with Session() as session:
             # Define DLCs
             DesignLoadCaseList.from_sql(session,ds)
+            step("designloadcases")
 
             # Read files
             ds.filelist=FileList.from_sql(session,ds)
+            step("files")
             
             # Read sensors
             ds.sensorlist=SensorList.from_sql(session)
+            step("sensors")
             
             # Get engine reference before closing session
             engine = session.get_bind()
@@ -347,6 +545,11 @@ class DataSet(object):
 
         return ds
     
+    @staticmethod
+    def from_sql_async(database_file:str, name:str=None,copy_to_temp=False)->AsyncJob:
+        """Run from_sql in a thread from an event loop, await the job for the DataSet and iterate over it for progress"""
+        return AsyncJob(DataSet.from_sql,database_file,name=name,copy_to_temp=copy_to_temp)
+
     @staticmethod
     def from_dataframe(df:pd.DataFrame, name:str, format=File,filecolumn="filepath",sensorcolumn="sensor")->"DataSet":
         """Create a DataSet from a DataFrame"""
@@ -377,48 +580,68 @@ class DataSet(object):
     def __str__(self):
         return f"DataSet: {self.name}"
     
-    def equivalent_load(self, sensor_names: list[str], m: float | list[float],Nref: float=1e7,filelist=None) -> pd.DataFrame:
-        """Calculate equivalent load for given sensors and m value"""
+    def equivalent_load(self, sensor_names: list[str], m: float | list[float],Nref: float=1e7,filelist=None,source:str="statistics") -> pd.DataFrame:
+        """Calculate equivalent load for given sensors and m value
+
+        source="statistics" uses the EquivalentLoad statistics of the sensors, which must exist for each m.
+        source="cycles" evaluates any m from the Markov cycles loaded by ingest, generate_markov or load_markov.
+        The per-file DELs of all sensors and m values are weighted by the file hours in one array operation.
+        """
+        if source not in ["statistics","cycles"]:
+            raise ValueError(f"Invalid source '{source}'. Must be 'statistics' or 'cycles'.")
         
         if filelist is None:
             filelist=self.filelist
 
-        hours=filelist.get_hours()
-        
         if isinstance(m,float) or isinstance(m,int):
             m=[m]
-        results=[]
-        for m_value in m:
-            data=[]
-            for sensor_name in sensor_names:
-                sensor = self.sensorlist.get_sensor(sensor_name)
-            
-                stat=[stat for stat in sensor.statistics if isinstance(stat, EquivalentLoad) and stat.params["m"] == m_value]
-                if len(stat)==0:
-                    raise ValueError(f"EquivalentLoad statistic with m={m_value} not found for sensor '{sensor_name}'. Please add it first.")
-            
-                stat=stat[0].name
-                Leq=sensor.data[stat]
-                Leq.name=sensor_name
-                data.append(Leq)
-        
-            df=pd.concat(data,axis=1)
-            df.columns.name="sensor"
-            df=df.stack().reset_index().set_index("filename").rename(columns={0: "DEL1Hz"})
-
-            df=df.join(hours, on="filename", how="left")
-            df["hours"]=df["hours"].fillna(0)
-        
+        sensor_names=sorted(set(sensor_names))
+        sensors=[self.sensorlist.get_sensor(sensor_name) for sensor_name in sensor_names]
+        data=[self._file_equivalent_loads(sensor,m_value,source) for m_value in m for sensor in sensors]
+
+        filenames=data[0].index
+        for Leq in data[1:]:
+            if not Leq.index.equals(filenames):
+                filenames=filenames.union(Leq.index)
+
+        # files x m x sensors
+        DEL1Hz=np.empty((len(filenames),len(data)))
+        has_file=np.ones((len(filenames),len(data)),dtype=bool)
+        for k, Leq in enumerate(data):
+            if not Leq.index.equals(filenames):
+                has_file[:,k]=filenames.isin(Leq.index)
+                Leq=Leq.reindex(filenames)
+            DEL1Hz[:,k]=Leq.to_numpy(dtype=float)
+        DEL1Hz=DEL1Hz.reshape(len(filenames),len(m),len(sensor_names))
+        has_file=has_file.reshape(DEL1Hz.shape)
+        hours=filelist.get_hours().reindex(filenames).fillna(0).to_numpy(dtype=float)[:,None,None]
+        exponent=np.array(m,dtype=float)[None,:,None]
+
+        damage=np.nansum(DEL1Hz**exponent*hours,axis=0)
+        with np.errstate(divide="ignore",invalid="ignore"):
             if isinstance(Nref,str) and Nref == "1Hz":
-                result=df.groupby("sensor").apply(lambda x: ( (x["DEL1Hz"]**m_value * x["hours"]).sum() / x["hours"].sum() )**(1/m_value) )
+                # every file with results for any of the sensors counts towards the total hours, even where the DEL is NaN
+                total_hours=np.sum(np.where(has_file.any(axis=2,keepdims=True),hours,0),axis=0)
+                Leq=(damage/total_hours)**(1/exponent[0])
             else:
-                result=df.groupby("sensor").apply(lambda x: ( (x["DEL1Hz"]**m_value * 3600 * x["hours"]).sum() / Nref )**(1/m_value) )
-            result=result.to_frame(name="equivalent_load")
-            result["m"]=m_value
-            result["Nref"]=Nref
-            results.append(result)
+                Leq=(damage*3600/Nref)**(1/exponent[0])
 
-        return pd.concat(results)
+        result=pd.DataFrame({
+            "equivalent_load": Leq.ravel(),
+            "m": np.repeat(m,len(sensor_names)),
+            "Nref": Nref,
+            },index=pd.Index(sensor_names*len(m),name="sensor"))
+        return result
+
+    def _file_equivalent_loads(self,sensor:Sensor,m:float,source:str) -> pd.Series:
+        """Return the 1Hz equivalent load of each file for a sensor from its statistics or Markov cycles"""
+        if source=="cycles":
+            return sensor.equivalent_load_from_cycles(m)
+
+        stat=[stat for stat in sensor.statistics if isinstance(stat, EquivalentLoad) and stat.params["m"] == m]
+        if len(stat)==0:
+            raise ValueError(f"EquivalentLoad statistic with m={m} not found for sensor '{sensor.name}'. Please add it first, or use source='cycles'.")
+        return sensor.data[stat[0].name]
 
 
     def extreme_load(self, sensor_names: list[str],characteristic=False,filelist=None) -> pd.DataFrame:
@@ -429,12 +652,8 @@ class DataSet(object):
         if filelist.get_groups().isna().all():
             raise ValueError("FileList groups are not set. Please set groups first using 'set_groups' method.")
 
-        # build dataframe with all sensor data
-        dfs= []
-        for sensor_name in sensor_names:
-            extremes_sensor = self.sensorlist.get_sensor(sensor_name)._extreme_load(filelist=filelist,characteristic=characteristic)    
-            dfs.append(extremes_sensor)
-        df=pd.concat(dfs,axis=0)
+        sensors=SensorList([self.sensorlist.get_sensor(name) for name in sensor_names])
+        df=sensors._extreme_load(filelist=filelist,characteristic=characteristic)
         return df
 
     def contemporaneous_load(self, sensor_names: list[str],characteristic=False,filelist=None) -> pd.DataFrame:
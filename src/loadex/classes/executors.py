@@ -0,0 +1,390 @@
+"""Executors that run a File task (generate_statistics, generate_markov, ingest) over many files.
+
+DataSet methods take executor="serial", "thread" or "process", or an Executor instance. A
+concurrent.futures.Executor (e.g. a ProcessPoolExecutor or a dask client's executor) is wrapped in a
+FuturesExecutor. Custom backends subclass Executor and implement map_files.
+"""
+import collections
+import concurrent.futures
+import math
+import multiprocessing
+import os
+import time
+from dataclasses import dataclass
+from pathlib import Path
+
+from loadex.classes.sensorlist import SensorList
+
+
+def default_workers() -> int:
+    """Return the number of CPUs this process may use, respecting CPU affinity and cgroup CPU quotas"""
+    try:
+        n = len(os.sched_getaffinity(0))
+    except AttributeError:
+        n = os.cpu_count() or 1
+
+    limit = _cgroup_cpu_limit()
+    if limit is not None:
+        n = min(n, max(1, math.floor(limit)))
+    return n
+
+
+def _cgroup_cpu_limit() -> float:
+    """Return the CPU quota of the cgroup in CPUs, or None if there is no limit"""
+    try:
+        quota, period = Path("/sys/fs/cgroup/cpu.max").read_text().split()[:2]
+        if quota != "max":
+            return int(quota) / int(period)
+        return None
+    except (OSError, ValueError):
+        pass
+
+    try:
+        quota = int(Path("/sys/fs/cgroup/cpu/cpu.cfs_quota_us").read_text())
+        period = int(Path("/sys/fs/cgroup/cpu/cpu.cfs_period_us").read_text())
+        if quota > 0:
+            return quota / period
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+@dataclass
+class FileFailure:
+    """A file that could not be processed
+
+    reason is "failed" if the task returned failure, "error" if it raised, "timeout" if it exceeded the
+    per-file timeout and "crashed" if its worker process died.
+    """
+
+    filepath: str
+    reason: str
+    attempts: int = 1
+    message: str = None
+
+    def __str__(self):
+        details = f"{self.reason} after {self.attempts} attempt{'s' if self.attempts > 1 else ''}"
+        if self.message:
+            details += f": {self.message}"
+        return f"{self.filepath} ({details})"
+
+
+def _without_data(arg):
+    """Return sensor lists without their statistics and Markov data, other arguments unchanged"""
+    if isinstance(arg, SensorList):
+        return arg.without_data()
+    return arg
+
+
+def _strip_arguments(args: tuple, kwargs: dict) -> tuple[tuple, dict]:
+    return tuple(_without_data(arg) for arg in args), {key: _without_data(arg) for key, arg in kwargs.items()}
+
+
+def _descriptors(files) -> list[tuple]:
+    """Return (index, type, filepath, metadata) descriptors to reopen the files in another process"""
+    return [(i, type(file), str(file.filepath), file.metadata) for i, file in enumerate(files)]
+
+
+def _run_file_task(descriptor: tuple, task: str, args: tuple, kwargs: dict) -> tuple:
+    """Open a file from its (index, type, filepath, metadata) descriptor and run the task on it
+
+    Returns the index, the task output, the file metadata, which the task may have read from the file, and
+    the seconds the file took.
+    """
+    start = time.perf_counter()
+    index, file_type, filepath, metadata = descriptor
+    try:
+        file = file_type(filepath, metadata)
+    except Exception as e:
+        print(f"Error opening file {filepath}: {e}")
+        return index, (False,), metadata, time.perf_counter() - start
+    output = getattr(file, task)(*args, **kwargs)
+    file.clear_connections()
+    return index, output, file.metadata, time.perf_counter() - start
+
+
+# task and arguments shared by all files, set once in each pool worker by _init_worker
+_worker_task = None
+
+
+def _init_worker(task: str, args: tuple, kwargs: dict):
+    """Receive the task and its arguments once per pool worker instead of with every file"""
+    global _worker_task
+    _worker_task = (task, args, kwargs)
+
+
+def _run_worker_task(descriptor: tuple) -> tuple:
+    task, args, kwargs = _worker_task
+    return _run_file_task(descriptor, task, args, kwargs)
+
+
+class Executor(object):
+    """Runs a File task on a list of files"""
+
+    def map_files(self, files, task: str, args: tuple, kwargs: dict):
+        """Call file.<task>(*args, **kwargs) for each file
+
+        Yields (index, output, metadata, seconds, failure) in the order the files finish, where output is the return
+        value of the task, metadata the file metadata afterwards, seconds the time the task took and failure a
+        FileFailure if the task could not be run, in which case output is (False,) and seconds may be None.
+        """
+        raise NotImplementedError("Subclasses must implement map_files")
+
+
+class SerialExecutor(Executor):
+    """Runs the files one after another in this process"""
+
+    def map_files(self, files, task: str, args: tuple, kwargs: dict):
+        for i, file in enumerate(files):
+            start = time.perf_counter()
+            try:
+                output = getattr(file, task)(*args, **kwargs)
+            except Exception as e:
+                yield i, (False,), file.metadata, None, FileFailure(str(file.filepath), "error", message=repr(e))
+                continue
+            finally:
+                file.clear_cycles()
+            yield i, output, file.metadata, time.perf_counter() - start, None
+
+
+class ThreadExecutor(Executor):
+    """Runs the files in a thread pool, sharing the file and sensor objects without pickling
+
+    Only faster than serial for formats whose reading and statistics release the GIL. Files of formats whose
+    sensor_executor is "process", e.g. BladedOutFile as the Bladed API is not documented as thread-safe, are
+    not read from several threads: the files are then run one after another.
+    """
+
+    def __init__(self, workers: int = None):
+        self.workers = workers or default_workers()
+
+    def map_files(self, files, task: str, args: tuple, kwargs: dict):
+        if any(file.sensor_executor == "process" for file in files):
+            print("Files of this format cannot be read from several threads, running them one after another")
+            yield from SerialExecutor().map_files(files, task, args, kwargs)
+            return
+
+        def run(i, file):
+            start = time.perf_counter()
+            try:
+                return i, getattr(file, task)(*args, **kwargs), file.metadata, time.perf_counter() - start, None
+            except Exception as e:
+                return i, (False,), file.metadata, None, FileFailure(str(file.filepath), "error", message=repr(e))
+            finally:
+                file.clear_cycles()
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.workers) as pool:
+            futures = [pool.submit(run, i, file) for i, file in enumerate(files)]
+            for future in concurrent.futures.as_completed(futures):
+                yield future.result()
+
+
+class ProcessExecutor(Executor):
+    """Runs the files in a process pool
+
+    The sensor lists are sent once per worker without data and each task only carries a file descriptor,
+    the files are reopened in the workers. start_method defaults to "spawn": forking a process that holds
+    Bladed results API state is not safe.
+
+    timeout is the number of seconds a file may take, including the start of a new worker. The workers are
+    then killed, as a hung native call cannot be interrupted, and the other files in progress are resubmitted.
+    Files that time out or whose worker crashes are retried up to retries times. If a worker crashes with
+    several files in progress, those files are rerun one at a time to find the one that crashes it. max_tasks_per_child replaces
+    each worker after that many files, releasing memory leaked by native readers.
+
+    Used as a context manager, e.g. by a long-running service, the pool is kept between map_files calls until the
+    with block exits, so the workers are started once. The task arguments are then sent with each file.
+    """
+
+    def __init__(self, workers: int = None, start_method: str = "spawn", timeout: float = None, retries: int = 0, max_tasks_per_child: int = None):
+        self.workers = workers or default_workers()
+        self.start_method = start_method
+        self.timeout = timeout
+        self.retries = retries
+        self.max_tasks_per_child = max_tasks_per_child
+        self._keep_pool = False
+        self._pool = None
+
+    def __enter__(self):
+        self._keep_pool = True
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+
+    def shutdown(self):
+        """Shut down the pool kept by the with block"""
+        self._keep_pool = False
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+            self._pool = None
+
+    def _new_pool(self, initargs: tuple = None) -> concurrent.futures.ProcessPoolExecutor:
+        """Start a pool whose workers receive initargs for _init_worker, or receive the task arguments with each file"""
+        options = {}
+        if self.max_tasks_per_child is not None:
+            options["max_tasks_per_child"] = self.max_tasks_per_child
+        if initargs is not None:
+            options["initializer"] = _init_worker
+            options["initargs"] = initargs
+        return concurrent.futures.ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context(self.start_method),
+            **options,
+        )
+
+    @staticmethod
+    def _kill_pool(pool: concurrent.futures.ProcessPoolExecutor):
+        """Kill the worker processes of a pool, including any hung in a task"""
+        if hasattr(pool, "kill_workers"):
+            pool.kill_workers()
+        else:
+            for process in list((pool._processes or {}).values()):
+                process.kill()
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def map_files(self, files, task: str, args: tuple, kwargs: dict):
+        args, kwargs = _strip_arguments(args, kwargs)
+        pending = collections.deque(_descriptors(files))
+        attempts = collections.Counter()
+        # files in progress when a worker crashed, rerun one at a time to find the one that crashes it
+        suspects = set()
+        running = {}
+        keep_pool = self._keep_pool
+        pool = self._pool if keep_pool else None
+
+        def submit(descriptor):
+            if keep_pool:
+                return pool.submit(_run_file_task, descriptor, task, args, kwargs)
+            return pool.submit(_run_worker_task, descriptor)
+
+        def retry_or_fail(descriptor, reason, message=None):
+            """Resubmit a file that timed out or crashed, or return its failure if out of retries"""
+            index, _, filepath, metadata = descriptor
+            if attempts[index] <= self.retries:
+                print(f"retrying file after {reason}: {filepath}")
+                pending.append(descriptor)
+                return None
+            return index, (False,), metadata, None, FileFailure(filepath, reason, attempts[index], message)
+
+        try:
+            while pending or running:
+                if pool is None:
+                    pool = self._new_pool(None if keep_pool else (task, args, kwargs))
+                    if keep_pool:
+                        self._pool = pool
+
+                # only as many files as workers are submitted, so each file starts when it is submitted
+                while pending and len(running) < self.workers and not suspects.intersection(d[0] for d, _ in running.values()):
+                    if pending[0][0] in suspects and running:
+                        break
+                    descriptor = pending.popleft()
+                    attempts[descriptor[0]] += 1
+                    print(f"adding file to queue: {descriptor[2]}")
+                    deadline = time.monotonic() + self.timeout if self.timeout is not None else None
+                    running[submit(descriptor)] = (descriptor, deadline)
+
+                deadlines = [deadline for _, deadline in running.values() if deadline is not None]
+                wait = max(0.0, min(deadlines) - time.monotonic()) if deadlines else None
+                done, _ = concurrent.futures.wait(running, timeout=wait, return_when=concurrent.futures.FIRST_COMPLETED)
+
+                crash = None
+                for future in done:
+                    descriptor, _ = running.pop(future)
+                    try:
+                        yield future.result() + (None,)
+                    except concurrent.futures.process.BrokenProcessPool as e:
+                        crash = repr(e)
+                        running[future] = (descriptor, None)
+                    except Exception as e:
+                        yield descriptor[0], (False,), descriptor[3], None, FileFailure(descriptor[2], "error", attempts[descriptor[0]], repr(e))
+
+                if crash is not None:
+                    # the pool is broken and all files in progress are lost
+                    lost = [descriptor for descriptor, _ in running.values()]
+                    if len(lost) == 1:
+                        result = retry_or_fail(lost[0], "crashed", crash)
+                        if result:
+                            yield result
+                    else:
+                        for descriptor in lost:
+                            print(f"retrying file after crash: {descriptor[2]}")
+                            attempts[descriptor[0]] -= 1
+                            suspects.add(descriptor[0])
+                            pending.append(descriptor)
+                else:
+                    now = time.monotonic()
+                    expired = [future for future, (_, deadline) in running.items() if deadline is not None and now >= deadline]
+                    if not expired:
+                        continue
+                    for future in expired:
+                        descriptor, _ = running.pop(future)
+                        result = retry_or_fail(descriptor, "timeout", f"exceeded {self.timeout}s")
+                        if result:
+                            yield result
+                    # the other files in progress are lost with the pool and resubmitted first
+                    for descriptor, _ in reversed(list(running.values())):
+                        attempts[descriptor[0]] -= 1
+                        pending.appendleft(descriptor)
+
+                running.clear()
+                self._kill_pool(pool)
+                pool = None
+                if keep_pool:
+                    self._pool = None
+        finally:
+            if keep_pool:
+                for future in running:
+                    future.cancel()
+            elif pool is not None:
+                pool.shutdown(cancel_futures=True)
+
+
+class FuturesExecutor(Executor):
+    """Runs the files on a concurrent.futures.Executor, reopening each file from its descriptor"""
+
+    def __init__(self, executor: concurrent.futures.Executor):
+        self.executor = executor
+
+    def map_files(self, files, task: str, args: tuple, kwargs: dict):
+        args, kwargs = _strip_arguments(args, kwargs)
+        descriptors = _descriptors(files)
+        futures = {self.executor.submit(_run_file_task, descriptor, task, args, kwargs): descriptor for descriptor in descriptors}
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                yield future.result() + (None,)
+            except Exception as e:
+                index, _, filepath, metadata = futures[future]
+                yield index, (False,), metadata, None, FileFailure(filepath, "error", message=repr(e))
+
+
+executors = {
+    "serial": SerialExecutor,
+    "thread": ThreadExecutor,
+    "process": ProcessExecutor,
+}
+
+
+def get_executor(executor: "str | Executor | concurrent.futures.Executor" = None, workers: int = None, **options) -> Executor:
+    """Return an Executor from a name in executors, an Executor or a concurrent.futures.Executor
+
+    workers sets the number of workers of named executors, defaulting to default_workers(). options
+    (timeout, retries, max_tasks_per_child) are passed to the "process" executor.
+    """
+    if executor is None:
+        executor = "serial"
+    if isinstance(executor, Executor):
+        return executor
+    if isinstance(executor, concurrent.futures.Executor):
+        return FuturesExecutor(executor)
+    if executor not in executors:
+        raise ValueError(f"Invalid executor '{executor}'. Must be one of {list(executors.keys())}, an Executor or a concurrent.futures.Executor.")
+
+    options = {key: value for key, value in options.items() if value is not None}
+    if executor == "process":
+        return ProcessExecutor(workers, **options)
+    if options:
+        raise ValueError(f"{list(options.keys())} are only supported by the 'process' executor.")
+    if executor == "serial":
+        return SerialExecutor()
+    return executors[executor](workers)
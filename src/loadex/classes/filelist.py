@@ -4,8 +4,12 @@ import pandas as pd
 from pathlib import Path
 from typing import List, Dict
 import json
+import math
+import zlib
+import concurrent.futures
+import multiprocessing
 
-import rainflow
+import numpy as np
 
 import matplotlib.pyplot as plt
 import plotly.graph_objects as go
@@ -13,11 +17,30 @@ import plotly.graph_objects as go
 from loadex.classes.designloadcases import DesignLoadCase
 from loadex.data import datamodel
 from loadex.classes.sensorlist import SensorList, Sensor
+from loadex.classes import statistics, cyclecounting
+
+
+def _sensor_group_statistics(descriptor: tuple, sensors: "SensorList", t: pd.Series, block_size: int, chunk_size: int, names: set[str]) -> tuple[dict, dict]:
+    """Reopen a file from its (type, filepath, metadata) descriptor and calculate the statistics of a sensor group
+
+    Returns the statistics and the rainflow cycles of the sensors in names, for the Markov tables.
+    """
+    file_type, filepath, metadata = descriptor
+    file=file_type(filepath, metadata)
+    try:
+        file_stats=file._statistics(sensors, t, block_size, chunk_size, names=names)
+        cycles={name: file._cycles[name] for name in names if name in file._cycles}
+    finally:
+        file.clear_connections()
+    return file_stats, cycles
 
 
 class File(object):
     """Contains a file from a loads dataset"""
 
+    # default pool for sensor_workers, "process" for formats whose reader is not safe to use from several threads
+    sensor_executor = "thread"
+
     def __init__(self, filepath: str,metadata:Dict=None):
         self.filepath = Path(filepath)
         self.metadata = metadata if metadata is not None else {}
@@ -26,6 +49,8 @@ class File(object):
         self.group = None
         self.hours = None
 
+        self._cycles = {}
+
     @property
     @abstractmethod
     def sensor_names(self) -> List[str]:
@@ -43,17 +68,41 @@ class File(object):
     def set_metadata_from_file(self) -> dict:
         pass
     
+    def estimated_cost(self) -> float:
+        """Return the relative cost of processing the file, used to submit the largest files first
+
+        This default is the size of the file in bytes.
+        """
+        try:
+            return float(self.filepath.stat().st_size)
+        except OSError:
+            return 0.0
+
+    @classmethod
+    def estimated_costs(cls,files:list["File"]) -> list[float]:
+        """Return the estimated_cost of each file, overridden by formats that estimate many files faster at once"""
+        return [file.estimated_cost() for file in files]
+
     @abstractmethod
-    def get_time(self) -> pd.Series:
+    def get_time(self,time_range:tuple[float,float]=None) -> pd.Series:
+        """Return the time vector, or only the samples with time_range[0] <= time <= time_range[1] indexed from 0"""
         pass
 
     @abstractmethod
-    def get_data(self,sensor_name) -> pd.Series:
+    def get_data(self,sensor_name,time_range:tuple[float,float]=None) -> pd.Series:
+        """Return the timeseries of a sensor, or only the samples with time_range[0] <= time <= time_range[1] indexed from 0"""
         pass
     
-    def get_timeseries(self,sensor_name) -> pd.Series:
+    def get_timeseries(self,sensor_name,time_range:tuple[float,float]=None) -> pd.Series:
         """Alias for get_data. Return the timeseries data for a given sensor as a pandas Series"""
-        return self.get_data(sensor_name)
+        return self.get_data(sensor_name,time_range)
+
+    @staticmethod
+    def time_range_slice(time:np.ndarray,time_range:tuple[float,float]) -> slice:
+        """Return the slice of a sorted time vector with time_range[0] <= time <= time_range[1]"""
+        start=np.searchsorted(time,time_range[0],side="left")
+        stop=np.searchsorted(time,time_range[1],side="right")
+        return slice(int(start),int(stop))
 
     @abstractmethod
     def to_dataframe(self) -> pd.DataFrame:
@@ -61,20 +110,234 @@ class File(object):
 
     def clear_connections(self):
         """Clear any connections to external resources before serialization"""
-        pass
+        self.clear_cycles()
+
+    def get_cycles(self, sensor: "Sensor", timeseries: pd.Series=None) -> np.ndarray:
+        """Return the rainflow cycles (range, mean, count) of a sensor, counted once per file
+
+        The cycles are shared by every statistic with uses_cycles and by generate_markov until
+        clear_cycles is called. Pass timeseries if the sensor data is already loaded.
+        """
+        if sensor.name not in self._cycles:
+            if timeseries is None:
+                timeseries=sensor.get_timeseries(self)
+            self._cycles[sensor.name]=statistics.extract_cycles(timeseries)
+        return self._cycles[sensor.name]
+
+    def count_block_cycles(self, sensorlist: "SensorList", block: np.ndarray, names: set[str]=None):
+        """Count the rainflow cycles of all columns of a (time x sensors) block that need them, in one batch
+
+        Columns need cycles if the sensor has a statistic with uses_cycles or its name is in names.
+        """
+        names=names or set()
+        columns=[j for j, sensor in enumerate(sensorlist)
+                 if sensor.name not in self._cycles
+                 and (sensor.name in names or any(stat.uses_cycles for stat in sensor.statistics))]
+        if not columns:
+            return
+        for j, cycles in zip(columns, cyclecounting.extract_cycles_batch(block[:, columns])):
+            self._cycles[sensorlist[j].name]=cycles
+
+    def clear_cycles(self):
+        """Release the cached rainflow cycles"""
+        self._cycles = {}
+
+    def get_data_block(self, sensorlist: "SensorList", n_time: int=None) -> np.ndarray:
+        """Return the timeseries of all sensors in the list as a (time x sensors) array"""
+        if n_time is None:
+            n_time=len(self.get_time())
+        block=np.empty((n_time, len(sensorlist)))
+        for j, sensor in enumerate(sensorlist):
+            block[:, j]=np.asarray(sensor.get_timeseries(self), dtype=float)
+        return block
+
+    def _block_statistics(self, sensorlist: "SensorList", block: np.ndarray, t: pd.Series) -> dict:
+        """Calculate the statistics of each sensor from its column of a (time x sensors) block
+
+        Sensors sharing a statistic are evaluated together with its batch aggregation function.
+        """
+        rows=[{stat.name: None for stat in sensor.statistics} for sensor in sensorlist]
+
+        groups={}
+        for j, sensor in enumerate(sensorlist):
+            for stat in sensor.statistics:
+                groups.setdefault((type(stat), stat.name), (stat, []))[1].append(j)
+
+        for stat, columns in groups.values():
+            if stat.uses_cycles:
+                cycles=[self.get_cycles(sensorlist[j], block[:, j]) for j in columns]
+                values=stat.batch_cycle_aggregation_function(cycles, t)
+            elif len(columns)==block.shape[1]:
+                values=stat.batch_aggregation_function(block, t)
+            else:
+                values=stat.batch_aggregation_function(block[:, columns], t)
+
+            for j, value in zip(columns, values):
+                rows[j][stat.name]=value
+
+        return {sensor.name: row for sensor, row in zip(sensorlist, rows)}
+
+    def _markov_table(self, sensor: "Sensor", duration: float) -> pd.DataFrame:
+        """Return the rainflow cycles of a sensor as a Markov cycle table"""
+        df=pd.DataFrame(self.get_cycles(sensor),columns=["range", "mean", "count"])
+        df["filepath"]=str(self.filepath)
+        df["sensor"]=sensor.name
+        df["simulation_duration"]=duration
+        return df
 
-    def generate_statistics(self, sensorlist: "SensorList")->tuple[bool,dict]:
-            #def calculate_statistics(self,filename: str, timeseries: pd.Series,timestamps: pd.Series):
-        """Calculate statistics for the file for each sensor and store them in a dictionary"""
+    @property
+    def reads_chunks(self) -> bool:
+        """Whether get_data_chunks reads one chunk at a time, rather than whole sensors"""
+        return False
+
+    def get_data_chunks(self, sensor_names: list[str], chunk_size: int):
+        """Yield the data of the file sensors as (time x sensors) arrays of at most chunk_size samples
+
+        This default reads each sensor whole and splits the block, so it is not used for chunk_size statistics
+        (see reads_chunks). Formats that can read a time window override it so that only one chunk is held
+        in memory.
+        """
+        block=np.empty((len(self.get_time()), len(sensor_names)))
+        for i, name in enumerate(sensor_names):
+            block[:, i]=np.asarray(self.get_data(name), dtype=float)
+        for start in range(0, len(block), chunk_size):
+            yield block[start:start+chunk_size]
+
+    def iter_data_blocks(self, sensorlist: "SensorList", chunk_size: int):
+        """Yield the timeseries of all sensors in the list as (time x sensors) arrays of at most chunk_size samples
+
+        Virtual sensors are evaluated chunk by chunk from their input sensors.
+        """
+        names=list(dict.fromkeys(name for sensor in sensorlist for name in sensor.file_sensor_names))
+        for chunk in self.get_data_chunks(names, chunk_size):
+            columns={name: pd.Series(chunk[:, i]) for i, name in enumerate(names)}
+            block=np.empty((len(chunk), len(sensorlist)))
+            for j, sensor in enumerate(sensorlist):
+                block[:, j]=np.asarray(sensor.get_timeseries_from_chunk(columns), dtype=float)
+            yield block
+
+    def _chunked_statistics(self, sensorlist: "SensorList", t: pd.Series, chunk_size: int, names: set[str]=None) -> dict:
+        """Calculate the statistics of each sensor from time chunks of at most chunk_size samples
+
+        Statistics with an accumulator and rainflow cycles are updated chunk by chunk, so the result matches
+        _block_statistics to rounding without holding whole timeseries. Other statistics are evaluated from
+        the whole timeseries of each sensor afterwards.
+        """
+        names=names or set()
+        rows=[{stat.name: None for stat in sensor.statistics} for sensor in sensorlist]
+
+        groups={}
+        for j, sensor in enumerate(sensorlist):
+            for stat in sensor.statistics:
+                groups.setdefault((type(stat), stat.name), (stat, []))[1].append(j)
+
+        accumulators={}
+        for key, (stat, columns) in groups.items():
+            if not stat.uses_cycles:
+                accumulators[key]=stat.accumulator(len(columns))
+
+        cycle_columns=[j for j, sensor in enumerate(sensorlist)
+                       if sensor.name not in self._cycles
+                       and (sensor.name in names or any(stat.uses_cycles for stat in sensor.statistics))]
+        counter=cyclecounting.StreamingCycleCounter(len(cycle_columns))
+
+        for block in self.iter_data_blocks(sensorlist, chunk_size):
+            for key, accumulator in accumulators.items():
+                if accumulator is not None:
+                    accumulator.update(block[:, groups[key][1]])
+            if cycle_columns:
+                counter.update(block[:, cycle_columns])
+
+        if cycle_columns:
+            for j, cycles in zip(cycle_columns, counter.finalize()):
+                self._cycles[sensorlist[j].name]=cycles
+
+        for key, (stat, columns) in groups.items():
+            if stat.uses_cycles:
+                values=stat.batch_cycle_aggregation_function([self.get_cycles(sensorlist[j]) for j in columns], t)
+            elif accumulators[key] is not None:
+                values=accumulators[key].result()
+            else:
+                values=[stat.aggregation_function(sensorlist[j].get_timeseries(self), t) for j in columns]
+
+            for j, value in zip(columns, values):
+                rows[j][stat.name]=value
+
+        return {sensor.name: row for sensor, row in zip(sensorlist, rows)}
+
+    def _statistics(self, sensorlist: "SensorList", t: pd.Series, block_size: int, chunk_size: int=None, names: set[str]=None,
+                    sensor_workers: int=None, sensor_executor: str=None) -> dict:
+        """Calculate the statistics of block_size sensors at a time, in memory or in time chunks
+
+        With sensor_workers, the sensors are split into groups of at most block_size that are evaluated in
+        parallel, see generate_statistics.
+        """
+        if sensor_workers is not None and sensor_workers>1 and len(sensorlist)>1:
+            return self._parallel_statistics(sensorlist, t, block_size, chunk_size, names, sensor_workers, sensor_executor)
+
+        if chunk_size is not None and not self.reads_chunks:
+            # chunks would be split from whole sensors, reading one sensor at a time holds less
+            block_size, chunk_size = 1, None
+
+        file_stats={}
+        for start in range(0, len(sensorlist), block_size):
+            sensors=sensorlist[start:start+block_size]
+            if chunk_size is None:
+                block=self.get_data_block(sensors, n_time=len(t))
+                self.count_block_cycles(sensors, block, names=names)
+                file_stats.update(self._block_statistics(sensors, block, t))
+            else:
+                file_stats.update(self._chunked_statistics(sensors, t, chunk_size, names=names))
+        return file_stats
+
+    def _parallel_statistics(self, sensorlist: "SensorList", t: pd.Series, block_size: int, chunk_size: int, names: set[str],
+                             sensor_workers: int, sensor_executor: str) -> dict:
+        """Calculate the statistics of groups of sensors in a thread or process pool with _statistics"""
+        names=names or set()
+        sensor_executor=sensor_executor or self.sensor_executor
+        group_size=min(block_size, math.ceil(len(sensorlist)/sensor_workers))
+        groups=[SensorList(sensorlist[start:start+group_size]) for start in range(0, len(sensorlist), group_size)]
+
+        if sensor_executor=="thread":
+            with concurrent.futures.ThreadPoolExecutor(max_workers=sensor_workers) as pool:
+                results=list(pool.map(lambda sensors: self._statistics(sensors, t, block_size, chunk_size, names=names), groups))
+        elif sensor_executor=="process":
+            # each worker reopens the file and reads only its own sensors
+            descriptor=(type(self), str(self.filepath), self.metadata)
+            with concurrent.futures.ProcessPoolExecutor(max_workers=sensor_workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+                futures=[pool.submit(_sensor_group_statistics, descriptor, sensors.without_data(), t, block_size, chunk_size, names) for sensors in groups]
+                results=[]
+                for future in futures:
+                    group_stats, cycles=future.result()
+                    self._cycles.update(cycles)
+                    results.append(group_stats)
+        else:
+            raise ValueError(f"Invalid sensor_executor '{sensor_executor}'. Must be 'thread' or 'process'.")
+
+        file_stats={}
+        for group_stats in results:
+            file_stats.update(group_stats)
+        return file_stats
+
+    def generate_statistics(self, sensorlist: "SensorList", block_size: int=512, chunk_size: int=None,
+                            sensor_workers: int=None, sensor_executor: str=None)->tuple[bool,dict]:
+        """Calculate statistics for the file for each sensor and store them in a dictionary
+
+        Sensors are read block_size at a time into a (time x sensors) block. Standard statistics are
+        evaluated for the whole block in one vectorized pass, other statistics per sensor column.
+        With chunk_size, the block is read chunk_size samples at a time and the statistics are
+        accumulated over the chunks, for timeseries that are too long to hold in memory. Formats that can only
+        read whole sensors (see reads_chunks) are then read one sensor at a time instead.
+        sensor_workers spreads groups of sensors over a "thread" or "process" sensor_executor, to use several
+        CPUs on one large file. Process workers reopen the file, for formats that cannot be read from threads.
+        sensor_executor defaults to the sensor_executor of the format.
+        """
         file_stats = {}
         try:
             print(f"loading file: {self.filepath}")
             self.set_metadata_from_file()
             t=self.get_time()
-            for sensor in sensorlist:
-                x=sensor.get_timeseries(self)
-                row={stat.name: stat.aggregation_function(x,t) for stat in sensor.statistics}
-                file_stats[sensor.name] = row
+            file_stats=self._statistics(sensorlist, t, block_size, chunk_size, sensor_workers=sensor_workers, sensor_executor=sensor_executor)
         except Exception as e:
             print(f"Error generating statistics for file {self.filepath}: {e}")
             return False, {}
@@ -84,20 +347,9 @@ class File(object):
         """Calculate Markov matrices for the file for each sensor and store them in a dictionary"""
         try:
             print(f"loading file: {self.filepath}")
-            dfs=[]
             t=self.get_time()
             duration=max(t)-min(t)
-            for sensor in sensorlist:
-                x=sensor.get_timeseries(self)
-
-                df_i=pd.DataFrame([cycle[0:3] for cycle in rainflow.extract_cycles(x)],columns=["range", "mean", "count"])
-                df_i["filepath"]=str(self.filepath)
-                df_i["sensor"]=sensor.name
-                df_i["simulation_duration"]=duration
-
-                dfs.append(df_i)
-            
-            markov=pd.concat(dfs, ignore_index=True)
+            markov=pd.concat([self._markov_table(sensor, duration) for sensor in sensorlist], ignore_index=True)
             if write_to_file:
                 markov.to_parquet(self.filepath.with_suffix('.markov.parquet'), index=False)
                 
@@ -106,21 +358,58 @@ class File(object):
             return False, None
         return True, markov
 
+    def ingest(self, sensorlist: "SensorList", markov_sensorlist: "SensorList"=None, write_to_file: bool=True, block_size: int=512, chunk_size: int=None,
+               sensor_workers: int=None, sensor_executor: str=None)->tuple[bool,dict,pd.DataFrame]:
+        """Calculate statistics and Markov cycles for the file, reading each sensor once
+
+        Equivalent to generate_statistics followed by generate_markov. markov_sensorlist defaults to the
+        sensors with a statistic that uses rainflow cycles, sensors not in sensorlist are read separately.
+        Returns the Markov table as None if there are no Markov sensors. See generate_statistics for chunk_size
+        and sensor_workers.
+        """
+        file_stats = {}
+        markov = None
+        try:
+            print(f"loading file: {self.filepath}")
+            self.set_metadata_from_file()
+            t=self.get_time()
+            duration=max(t)-min(t)
+
+            if markov_sensorlist is None:
+                markov_sensorlist=sensorlist.get_sensors(has_cycle_statistic=True)
+            markov_names={sensor.name for sensor in markov_sensorlist}
 
-    def plot_timeseries(self,sensor:str|Sensor, axis=None,scale:float=None,offset: float = None,time_offset:float = None,label=None,engine:str="matplotlib",row:int=None,col:int=None,line_color:str=None,showlegend:bool|None=None,legendgroup:str|None=None,xaxis_id:str|None=None,yaxis_id:str|None=None):
-        """Plot the data for a given sensor"""
+            file_stats=self._statistics(sensorlist, t, block_size, chunk_size, names=markov_names,
+                                        sensor_workers=sensor_workers, sensor_executor=sensor_executor)
 
+            if markov_sensorlist:
+                markov=pd.concat([self._markov_table(sensor, duration) for sensor in markov_sensorlist], ignore_index=True)
+                if write_to_file:
+                    markov.to_parquet(self.filepath.with_suffix('.markov.parquet'), index=False)
 
-        x = self.get_time()
+        except Exception as e:
+            print(f"Error ingesting file {self.filepath}: {e}")
+            return False, {}, None
+        return True, file_stats, markov
+
+
+    def plot_timeseries(self,sensor:str|Sensor, axis=None,scale:float=None,offset: float = None,time_offset:float = None,label=None,engine:str="matplotlib",row:int=None,col:int=None,line_color:str=None,showlegend:bool|None=None,legendgroup:str|None=None,xaxis_id:str|None=None,yaxis_id:str|None=None,time_range:tuple[float,float]=None):
+        """Plot the data for a given sensor
+
+        time_range (in the time of the file, before time_offset) plots and reads only part of the timeseries.
+        """
+
+
+        x = self.get_time(time_range)
         if time_offset:
             x=x+time_offset
         
         if isinstance(sensor, str):
             sensor_name=sensor
-            y = self.get_data(sensor)
+            y = self.get_data(sensor,time_range)
         else:
             sensor_name=sensor.name
-            y = sensor.get_timeseries(self)
+            y = sensor.get_timeseries(self,time_range)
         
         if scale:
             y=y*scale
@@ -296,6 +585,23 @@ class FileList(list):
             group_dict[group].append(file)
         return group_dict
 
+    def shard(self,n_shards:int,index:int,root:str=None)->"FileList":
+        """Return shard index (0 to n_shards-1) of the filelist
+
+        Files are assigned by a CRC32 of the filepath, relative to root if given, so the shards are the same on
+        every machine and do not change when files are added.
+        """
+        if not 0<=index<n_shards:
+            raise ValueError(f"Invalid shard index {index}. Must be between 0 and {n_shards-1}.")
+        
+        def key(file):
+            filepath=file.filepath
+            if root is not None:
+                filepath=filepath.relative_to(root)
+            return zlib.crc32(filepath.as_posix().encode("utf-8"))
+
+        return FileList([file for file in self if key(file)%n_shards==index])
+
     def to_sql(self,session,dlc_id:pd.Series=None):
         """Store filelist in database"""
 
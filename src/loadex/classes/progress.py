@@ -0,0 +1,49 @@
+import time
+from dataclasses import dataclass, field
+
+
+@dataclass
+class Progress:
+    """Progress of a run over the files of a DataSet, passed to progress callbacks after each file"""
+
+    total: int
+    done: int = 0
+    failed: int = 0
+    filepath: str = None
+    success: bool = None
+    start_time: float = field(default_factory=time.perf_counter)
+
+    def update(self, filepath: str, success: bool):
+        """Record a finished file"""
+        self.done += 1
+        if not success:
+            self.failed += 1
+        self.filepath = filepath
+        self.success = success
+
+    @property
+    def elapsed(self) -> float:
+        """Seconds since the run started"""
+        return time.perf_counter() - self.start_time
+
+    @property
+    def files_per_second(self) -> float:
+        elapsed = self.elapsed
+        return self.done / elapsed if elapsed > 0 else 0.0
+
+    @property
+    def eta(self) -> float:
+        """Estimated seconds until all files are finished, None before the first file"""
+        if self.done == 0:
+            return None
+        return (self.total - self.done) / self.files_per_second
+
+    def __str__(self):
+        eta = "-" if self.eta is None else f"{self.eta:.0f}s"
+        return (f"{self.done}/{self.total} files ({self.failed} failed), "
+                f"{self.files_per_second:.2f} files/s, ETA {eta}")
+
+
+def print_progress(progress: Progress):
+    """Progress callback that prints one line per file"""
+    print(f"[{progress}] {progress.filepath}")
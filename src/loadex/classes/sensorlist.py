@@ -1,5 +1,8 @@
+import copy
 import json
+import warnings
 from loadex.classes import statistics, filelist, designloadcases
+import numpy as np
 import pandas as pd
 
 from loadex.data import datamodel
@@ -19,9 +22,18 @@ class Sensor(object):
         self.metadata = metadata
 
 
-    def get_timeseries(self,file):
-        """Return the timeseries data for this sensor as a pandas Series"""
-        return file.get_data(self.name)
+    def get_timeseries(self,file,time_range:tuple[float,float]=None):
+        """Return the timeseries data for this sensor as a pandas Series, optionally only within time_range"""
+        return file.get_data(self.name,time_range)
+
+    @property
+    def file_sensor_names(self) -> list[str]:
+        """Names of the file sensors the timeseries is read from"""
+        return [self.name]
+
+    def get_timeseries_from_chunk(self, chunk: dict[str, pd.Series]):
+        """Return the timeseries for this sensor from already loaded file sensor data, e.g. one time chunk"""
+        return chunk[self.name]
     
     
     def _insert_generated_statistics(self,new_data:pd.DataFrame):
@@ -56,6 +68,22 @@ class Sensor(object):
         # append cache
         self.markovcycles = pd.concat([self.markovcycles, new_data], axis=0)
 
+    def equivalent_load_from_cycles(self,m:float)->pd.Series:
+        """Return the 1Hz equivalent load of each file from the Markov cycles, for any Wöhler exponent m
+
+        Uses the cycles from ingest, generate_markov or load_markov, so the result files are not read again.
+        """
+        if self.markovcycles.empty:
+            raise ValueError(f"No Markov cycles for sensor '{self.name}'. Please run ingest, generate_markov or load_markov first.")
+
+        codes, filenames = pd.factorize(self.markovcycles.index)
+        cycles=self.markovcycles[["range","count"]].to_numpy(dtype=float)
+        damage=np.bincount(codes, weights=cycles[:,1]*cycles[:,0]**m, minlength=len(filenames))
+        duration=self.markovcycles["simulation_duration"].groupby(codes).first().to_numpy(dtype=float)
+
+        Leq=(damage/duration)**(1/m)
+        return pd.Series(Leq, index=pd.Index(filenames, name="filename"), name=f"DEL1Hz_m{m}")
+
     def markov_matrix(self,filelist,range_bins=50,mean_bins=50):
         """Calculate Markov transition matrix for the sensor"""
         fileindex=filelist.to_index()
@@ -81,6 +109,13 @@ class Sensor(object):
 
         return markov_matrix
 
+    def without_data(self)->"Sensor":
+        """Return a copy of the sensor definition without the statistics and Markov data, e.g. to send to worker processes"""
+        sensor=copy.copy(self)
+        sensor.data=pd.DataFrame()
+        sensor.markovcycles=pd.DataFrame()
+        return sensor
+
     def add_rainflow_statistics(self, m: list[float] = [3,4,5]):
         """Add rainflow statistics to the sensor"""
         for wohler in m:
@@ -145,80 +180,7 @@ class Sensor(object):
     
     def _extreme_load(self,filelist:"filelist.FileList",characteristic=False,absmax=True)->pd.DataFrame:
         """Return a DataFrame with extreme loads for each group"""
-        
-        df_file=filelist.to_dataframe().loc[:,["dlc","group","averaging_method","partial_safety_factor"]]
-        if characteristic:
-            df_file["partial_safety_factor"]=1.0
-
-        df=pd.concat([df_file,self.data],axis=1)
-        df["absmax"]=df[["min","max"]].abs().max(axis=1)
-
-        mean_of_max = (
-            df[["dlc", "group", "partial_safety_factor", "max", "averaging_method"]]
-            .groupby(["dlc", "group"])
-            .apply(
-                lambda x: pd.Series(
-                    {
-                        "partial_safety_factor": x["partial_safety_factor"].iloc[0],
-                        "value": designloadcases.DesignLoadCase.apply_averaging(
-                            x["max"] * x["partial_safety_factor"], x["averaging_method"]
-                        ),
-                    }
-                )
-            )
-            .reset_index()
-        )
-        mean_of_max=mean_of_max.loc[mean_of_max.loc[:,"value"].idxmax(),:]
-        mean_of_max["extreme"]="mean_of_max"
-
-        mean_of_min = (
-            df[["dlc", "group", "partial_safety_factor", "min", "averaging_method"]]
-            .groupby(["dlc", "group"])
-            .apply(
-                lambda x: pd.Series(
-                    {
-                        "partial_safety_factor": x["partial_safety_factor"].iloc[0],
-                        "value": designloadcases.DesignLoadCase.apply_averaging(
-                            x["min"] * x["partial_safety_factor"], x["averaging_method"]
-                        ),
-                    }
-                )
-            )
-            .reset_index()
-        )
-        mean_of_min = mean_of_min.loc[mean_of_min.loc[:, "value"].idxmin(), :]
-        mean_of_min["extreme"]="mean_of_min"
-
-        if not absmax:
-            extremes=pd.DataFrame([mean_of_max,mean_of_min]).reset_index(drop=True)
-
-        else: #add absmax is requested
-            mean_of_absmax = (
-                df[["dlc", "group", "partial_safety_factor", "absmax", "averaging_method"]]
-                .groupby(["dlc", "group"])
-                .apply(
-                    lambda x: pd.Series(
-                        {
-                            "partial_safety_factor": x["partial_safety_factor"].iloc[0],
-                            "value": designloadcases.DesignLoadCase.apply_averaging(
-                                x["absmax"] * x["partial_safety_factor"], x["averaging_method"]
-                            ),
-                        }
-                    )
-                )
-                .reset_index()
-            )
-            mean_of_absmax = mean_of_absmax.loc[mean_of_absmax.loc[:, "value"].idxmax(), :]
-            mean_of_absmax["extreme"]="mean_of_absmax"
-
-            extremes=pd.DataFrame([mean_of_max,mean_of_min,mean_of_absmax]).reset_index(drop=True)
-        
-        extremes["sensor"] = self.name
-        
-        # set index and reorder columns
-        extremes= extremes.set_index("sensor")[["extreme","dlc","group","partial_safety_factor","value"]]
-        
-        return extremes
+        return SensorList([self])._extreme_load(filelist=filelist,characteristic=characteristic,absmax=absmax)
 
 
     def has_statistic(self,statistic_name:str)->bool:
@@ -242,7 +204,7 @@ class SensorList(list):
                 return sensor
         raise ValueError(f"Sensor '{name}' not found in sensorlist.")
     
-    def get_sensors(self, pattern: str=None,has_statistic:str=None,metadata:dict=None) -> "SensorList":
+    def get_sensors(self, pattern: str=None,has_statistic:str=None,metadata:dict=None,has_cycle_statistic:bool=False) -> "SensorList":
         """Return a list of sensors by pattern"""
         sensors=self
         if pattern:
@@ -253,6 +215,9 @@ class SensorList(list):
         if has_statistic:
             sensors = [s for s in sensors if s.has_statistic(has_statistic)]
 
+        if has_cycle_statistic:
+            sensors = [s for s in sensors if any(stat.uses_cycles for stat in s.statistics)]
+
         if metadata:
             for key, value in metadata.items():
                 if callable(value):
@@ -262,6 +227,10 @@ class SensorList(list):
 
         return SensorList(sensors)
 
+    def without_data(self)->"SensorList":
+        """Return a copy of the sensor list without the statistics and Markov data of the sensors"""
+        return SensorList([sensor.without_data() for sensor in self])
+
     def add_rainflow_statistics(self, m: list[float] = [3,4,5]):
         """Add rainflow statistics to all sensors in the list"""
         for sensor in self:
@@ -505,12 +474,82 @@ class SensorList(list):
         df.index.name="sensor_name"
         return df
     
+    def _extreme_load(self,filelist:"filelist.FileList",characteristic=False,absmax=True)->pd.DataFrame:
+        """Return a DataFrame with the extreme loads of each sensor, over the groups of the files
+
+        The max, min and absmax of every sensor are averaged per (dlc, group) together as files x sensors
+        arrays, then the group with the largest (smallest for min) value is taken for each sensor.
+        """
+        df_file=filelist.to_dataframe().loc[:,["dlc","group","averaging_method","partial_safety_factor"]]
+        if characteristic:
+            df_file["partial_safety_factor"]=1.0
+
+        # files in the same group are adjacent, groups in sorted order
+        codes=df_file.groupby(["dlc","group"]).ngroup().to_numpy()
+        order=np.argsort(codes,kind="stable")
+        order=order[codes[order]>=0]
+        df_file=df_file.iloc[order]
+        codes=codes[order]
+        starts=np.flatnonzero(np.diff(codes,prepend=-1))
+        ends=np.append(starts[1:],len(codes))
+
+        methods=df_file["averaging_method"].to_numpy()
+        for start, end in zip(starts,ends):
+            if len(pd.unique(methods[start:end]))>1:
+                raise ValueError(f"Multiple averaging methods found in the rows: {pd.unique(methods[start:end])}. Cannot apply averaging.")
+            if methods[start] not in designloadcases.averaging_methods:
+                raise ValueError(f"Invalid averaging method '{methods[start]}'. Must be one of {designloadcases.averaging_methods}.")
+
+        psf=df_file["partial_safety_factor"].to_numpy(dtype=float)
+        maxima=np.column_stack([sensor.data["max"].reindex(df_file.index).to_numpy(dtype=float) for sensor in self])
+        minima=np.column_stack([sensor.data["min"].reindex(df_file.index).to_numpy(dtype=float) for sensor in self])
+
+        extremes={"mean_of_max":(maxima,np.nanargmax),"mean_of_min":(minima,np.nanargmin)}
+        if absmax:
+            extremes["mean_of_absmax"]=(np.fmax(np.abs(maxima),np.abs(minima)),np.nanargmax)
+
+        group_keys=df_file.iloc[starts]
+        rows=[]
+        for extreme, (values, select) in extremes.items():
+            values=values*psf[:,None]
+
+            # groups x sensors
+            averaged=np.empty((len(starts),len(self)))
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore",category=RuntimeWarning)
+                for g, (start, end) in enumerate(zip(starts,ends)):
+                    rows_group=values[start:end]
+                    if methods[start]=="MeanHalf":
+                        # upper half of the sorted values, NaN sort last as in Series.sort_values
+                        rows_group=np.sort(rows_group,axis=0)[(end-start)//2:]
+                    averaged[g]=np.nanmean(rows_group,axis=0)
+
+            for j, sensor in enumerate(self):
+                if np.isnan(averaged[:,j]).all():
+                    raise ValueError(f"No {extreme} values found for sensor '{sensor.name}'.")
+            selected=select(averaged,axis=0)
+
+            rows.append(pd.DataFrame({
+                "sensor":self.names,
+                "extreme":extreme,
+                "dlc":group_keys["dlc"].to_numpy()[selected],
+                "group":group_keys["group"].to_numpy()[selected],
+                "partial_safety_factor":group_keys["partial_safety_factor"].to_numpy()[selected],
+                "value":averaged[selected,np.arange(len(self))],
+                "order":np.arange(len(self)),
+                }))
+
+        # one row per extreme, grouped by sensor
+        extremes=pd.concat(rows,ignore_index=True).sort_values("order",kind="stable")
+        return extremes.set_index("sensor")[["extreme","dlc","group","partial_safety_factor","value"]]
+
     def contemporaneous_load(self,filelist:"filelist.FileList", characteristic=False) -> pd.DataFrame:
         """Calculate contemporaneous load for the SensorList"""
         
+        all_extremes=self._extreme_load(filelist=filelist,characteristic=True,absmax=False)
         cntmp_sets=[]
         for primary_sensor in self:
-            extremes=primary_sensor._extreme_load(filelist=filelist,characteristic=True,absmax=False)
+            extremes=all_extremes.loc[[primary_sensor.name]]
             for _, ex in extremes.iterrows():
                 #contemporaneous
                 contemporaneous_group=[]
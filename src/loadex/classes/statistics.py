@@ -2,21 +2,51 @@ import json
 import sys
 import copy
 from pyparsing import abstractmethod
-import rainflow
+import warnings
+import numpy as np
 import pandas as pd
 
 from loadex.data import datamodel
+from loadex.classes import cyclecounting
 
 
 class Statistic(object):
     """Contains a statistic from a sensor"""
 
+    # statistics that set uses_cycles are evaluated from the rainflow cycles of the timeseries
+    uses_cycles = False
+
     def __init__(self, name: str):
         self.name = name
     
     @abstractmethod
     def aggregation_function(self, timeseries: pd.Series, timestamps: pd.Series):
          raise NotImplementedError("Subclasses must implement aggregation_function")
+
+    def cycle_aggregation_function(self, cycles: np.ndarray, timestamps: pd.Series):
+        """Evaluate the statistic from rainflow cycles (range, mean, count) instead of the timeseries"""
+        raise NotImplementedError("Subclasses with uses_cycles must implement cycle_aggregation_function")
+
+    def batch_aggregation_function(self, block: np.ndarray, timestamps: pd.Series) -> np.ndarray:
+        """Evaluate the statistic for each column of a (time x sensors) block, returning one value per column
+
+        Falls back to aggregation_function per column. Override to evaluate the whole block at once.
+        """
+        return np.array([self.aggregation_function(pd.Series(block[:, j]), timestamps) for j in range(block.shape[1])])
+
+    def batch_cycle_aggregation_function(self, cycles: list[np.ndarray], timestamps: pd.Series) -> np.ndarray:
+        """Evaluate the statistic from the rainflow cycles of each column, returning one value per column
+
+        Falls back to cycle_aggregation_function per column. Override to evaluate all columns at once.
+        """
+        return np.array([self.cycle_aggregation_function(column_cycles, timestamps) for column_cycles in cycles])
+
+    def accumulator(self, n_columns: int):
+        """Return an accumulator that evaluates the statistic from a block read in time chunks
+
+        Returns None if the statistic has no streaming form, it is then evaluated from the whole timeseries.
+        """
+        return None
     
     def copy(self):
         """Return a copy of the statistic"""
@@ -25,6 +55,66 @@ class Statistic(object):
     def __repr__(self):
         return f"{self.__class__.__name__}({self.name})"
 
+def _reduce_columns(block: np.ndarray, function, nan_function, **kwargs) -> np.ndarray:
+    """Reduce each column of a block, skipping NaN values as the pandas Series methods do"""
+    with warnings.catch_warnings():
+        # all-NaN or single sample columns return NaN, as pandas does
+        warnings.simplefilter("ignore", category=RuntimeWarning)
+        if np.isnan(block).any():
+            return nan_function(block, axis=0, **kwargs)
+        return function(block, axis=0, **kwargs)
+
+
+class MomentAccumulator(object):
+    """Running count, mean and sum of squared deviations of each column of a block read in time chunks
+
+    Each chunk is reduced on its own and merged with the running values (Chan et al.), NaN values are skipped.
+    """
+
+    def __init__(self, n_columns: int):
+        self.count = np.zeros(n_columns)
+        self.mean = np.zeros(n_columns)
+        self.m2 = np.zeros(n_columns)
+
+    def update(self, chunk: np.ndarray):
+        count = np.sum(~np.isnan(chunk), axis=0)
+        mean = np.where(count > 0, _reduce_columns(chunk, np.mean, np.nanmean), 0.0)
+        m2 = np.sum(np.where(np.isnan(chunk), 0.0, chunk - mean) ** 2, axis=0)
+
+        total = self.count + count
+        weight = np.divide(count, total, out=np.zeros_like(total), where=total > 0)
+        delta = mean - self.mean
+        self.mean = self.mean + delta * weight
+        self.m2 = self.m2 + m2 + delta ** 2 * self.count * weight
+        self.count = total
+
+
+class MeanAccumulator(MomentAccumulator):
+    def result(self) -> np.ndarray:
+        return np.where(self.count > 0, self.mean, np.nan)
+
+
+class StdAccumulator(MomentAccumulator):
+    def result(self) -> np.ndarray:
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(self.count > 1, np.sqrt(self.m2 / (self.count - 1)), np.nan)
+
+
+class ExtremeAccumulator(object):
+    """Running maximum or minimum of each column of a block read in time chunks, NaN values are skipped"""
+
+    def __init__(self, n_columns: int, function):
+        self.function = function
+        self.value = np.full(n_columns, np.nan)
+
+    def update(self, chunk: np.ndarray):
+        # fmax/fmin return the non-NaN value, so all-NaN columns stay NaN
+        self.value = self.function(self.value, self.function.reduce(chunk, axis=0, initial=np.nan))
+
+    def result(self) -> np.ndarray:
+        return self.value
+
+
 class Mean(Statistic):
     def __init__(self):
         super().__init__('mean')
@@ -32,6 +122,12 @@ class Mean(Statistic):
     def aggregation_function(self, timeseries: pd.Series, timestamps: pd.Series):
         return pd.Series.mean(timeseries)
 
+    def batch_aggregation_function(self, block: np.ndarray, timestamps: pd.Series) -> np.ndarray:
+        return _reduce_columns(block, np.mean, np.nanmean)
+
+    def accumulator(self, n_columns: int):
+        return MeanAccumulator(n_columns)
+
 
 class Max(Statistic):
     def __init__(self):
@@ -40,6 +136,12 @@ class Max(Statistic):
     def aggregation_function(self, timeseries: pd.Series, timestamps: pd.Series):
         return pd.Series.max(timeseries)
 
+    def batch_aggregation_function(self, block: np.ndarray, timestamps: pd.Series) -> np.ndarray:
+        return _reduce_columns(block, np.max, np.nanmax)
+
+    def accumulator(self, n_columns: int):
+        return ExtremeAccumulator(n_columns, np.fmax)
+
 
 class Min(Statistic):
     def __init__(self):
@@ -48,6 +150,12 @@ class Min(Statistic):
     def aggregation_function(self, timeseries: pd.Series, timestamps: pd.Series):
         return pd.Series.min(timeseries)
 
+    def batch_aggregation_function(self, block: np.ndarray, timestamps: pd.Series) -> np.ndarray:
+        return _reduce_columns(block, np.min, np.nanmin)
+
+    def accumulator(self, n_columns: int):
+        return ExtremeAccumulator(n_columns, np.fmin)
+
 
 class Std(Statistic):
     def __init__(self):
@@ -56,6 +164,12 @@ class Std(Statistic):
     def aggregation_function(self, timeseries: pd.Series, timestamps: pd.Series):
         return pd.Series.std(timeseries)
 
+    def batch_aggregation_function(self, block: np.ndarray, timestamps: pd.Series) -> np.ndarray:
+        return _reduce_columns(block, np.std, np.nanstd, ddof=1)
+
+    def accumulator(self, n_columns: int):
+        return StdAccumulator(n_columns)
+
 
 
 standard_statistics=[
@@ -105,18 +219,47 @@ class CustomStatistic(Statistic):
 
 
 class EquivalentLoad(CustomStatistic):
+    uses_cycles = True
+
     def __init__(self, m: float):
         super().__init__(name=f'DEL1Hz_m{m}',params={"m":m})
         
     def aggregation_function(self, timeseries: pd.Series, timestamps: pd.Series):
         return equivalent_load(timeseries, timestamps, self.params["m"])
 
+    def cycle_aggregation_function(self, cycles: np.ndarray, timestamps: pd.Series):
+        return equivalent_load_from_cycles(cycles, timestamps, self.params["m"])
+
+    def batch_aggregation_function(self, block: np.ndarray, timestamps: pd.Series) -> np.ndarray:
+        return self.batch_cycle_aggregation_function(cyclecounting.extract_cycles_batch(block), timestamps)
+
+    def batch_cycle_aggregation_function(self, cycles: list[np.ndarray], timestamps: pd.Series) -> np.ndarray:
+        m = self.params["m"]
+        T = max(timestamps) - min(timestamps)
+        n_columns = len(cycles)
+        column = np.repeat(np.arange(n_columns), [len(column_cycles) for column_cycles in cycles])
+        cycles = np.concatenate([np.empty((0, 3))] + list(cycles))
+        damage = np.bincount(column, weights=cycles[:, 2] * cycles[:, 0] ** m, minlength=n_columns)
+        return (damage / T) ** (1 / m)
+
+
+def extract_cycles(x: pd.Series, backend: str = None) -> np.ndarray:
+    """Return the rainflow cycles of a timeseries as an array with columns (range, mean, count)
+
+    backend selects the cycle counter, see cyclecounting.backends. Defaults to cyclecounting.get_backend().
+    """
+    return cyclecounting.extract_cycles(x, backend)
+
 
 def  equivalent_load(x: pd.Series, t: pd.Series, m: float):
     """Return the equivalent load"""
+    return equivalent_load_from_cycles(extract_cycles(x), t, m)
+
+
+def equivalent_load_from_cycles(cycles: np.ndarray, t: pd.Series, m: float):
+    """Return the equivalent load from rainflow cycles (range, mean, count)"""
     T = max(t) - min(t)
-    cycles = pd.DataFrame(rainflow.count_cycles(x), columns=['range', 'count'])
-    Leq = (sum(cycles['count'] * cycles['range'] ** m) / T) ** (1 / m)
+    Leq = (np.sum(cycles[:, 2] * cycles[:, 0] ** m) / T) ** (1 / m)
     return Leq
 
 
@@ -17,13 +17,28 @@ class VirtualSensor(sensorlist.Sensor):
         self.function = function  # A string expression that computes the virtual sensor's value
         self.inputs = inputs  # Dictionary of sensor names this virtual sensor depends on
 
-    def get_timeseries(self,file):
+    def get_timeseries(self,file,time_range:tuple[float,float]=None):
         """Compute the timeseries data for this virtual sensor by applying the function to the input sensors."""
 
-        input_data = {name: sensor.get_timeseries(file) for name, sensor in self.inputs.items()}
+        input_data = {name: sensor.get_timeseries(file,time_range) for name, sensor in self.inputs.items()}
+        return eval_with_dict(self.function, input_data)
+
+    @property
+    def file_sensor_names(self) -> list[str]:
+        """Names of the file sensors the input sensors are read from"""
+        return list(dict.fromkeys(name for sensor in self.inputs.values() for name in sensor.file_sensor_names))
+
+    def get_timeseries_from_chunk(self, chunk: dict[str, pd.Series]):
+        """Apply the function to the input sensors evaluated from already loaded file sensor data"""
+        input_data = {name: sensor.get_timeseries_from_chunk(chunk) for name, sensor in self.inputs.items()}
         return eval_with_dict(self.function, input_data)
     
 
+    def without_data(self)->"VirtualSensor":
+        sensor=super().without_data()
+        sensor.inputs={name: input_sensor.without_data() for name, input_sensor in self.inputs.items()}
+        return sensor
+
     def add_or_get_database_sensor(self,session):
         db_sensor=super().add_or_get_database_sensor(session)  # Ensure base sensor exists in DB
         db_sensor.is_virtual=True
@@ -0,0 +1,225 @@
+from pathlib import Path
+import argparse
+import time
+import warnings
+from filelock import FileLock
+
+from loadex.classes import DataSet
+from loadex.classes import executors
+from loadex.classes.executors import FileFailure
+from loadex.classes.filelist import FileList
+from loadex.data import datamodel
+from loadex.data.database import get_sqlite_session
+from loadex.formats import format_class
+
+
+def ingested_filepaths(db_file:Path)->set[str]:
+    """Return the filepaths already in a loads database"""
+    if not db_file.exists():
+        return set()
+    Session=get_sqlite_session(str(db_file),create_if_not_exists=False)
+    with Session() as session:
+        filepaths={filepath for (filepath,) in session.query(datamodel.File.filepath)}
+        engine=session.get_bind()
+    engine.dispose()
+    return filepaths
+
+def find_finished_files(directory:Path,file_format,ingested:set[str],failed:dict[str,float],settle_time:float)->list[Path]:
+    """Return the finished runs in a directory that are not ingested yet
+
+    A run is finished once its file matching the first default extension of the format (the $TE termination
+    file for Bladed) has existed unchanged for settle_time seconds. Failed files are retried once they change.
+    """
+    pattern='*' + file_format.defaultExtensions()[0]
+    now=time.time()
+    files=[]
+    for filepath in sorted(directory.rglob(pattern)):
+        if str(filepath) in ingested:
+            continue
+        try:
+            mtime=filepath.stat().st_mtime
+        except OSError:
+            continue
+        if now-mtime<settle_time or failed.get(str(filepath))==mtime:
+            continue
+        files.append(filepath)
+    return files
+
+def ingest_batch(directory:Path,filepaths:list[Path],db_file:Path,file_format,fatigue_sensor_spec:list[dict],processes:int=None,timeout:float=None,retries:int=None,executor=None)->list:
+    """Generate the statistics of a batch of files in a worker pool and write them to the database in one transaction
+
+    Sensors are set from the first file of the batch. Failed files are not written. executor is the pool to use,
+    by default a process pool for the batch. Returns the failures.
+    """
+    files=[]
+    failed=[]
+    for filepath in filepaths:
+        try:
+            file=file_format(str(filepath))
+            # formats may read lazily, read the sensor names so unreadable files fail here
+            file.sensor_names
+            files.append(file)
+        except Exception as e:
+            failed.append(FileFailure(str(filepath),"error",message=repr(e)))
+    if not files:
+        return failed
+
+    ds=DataSet('loadex.cli.ingest_daemon: ' +str(directory))
+    ds.filelist=FileList(files)
+    ds.set_sensors()
+
+    for spec in fatigue_sensor_spec:
+        ds.sensorlist.get_sensors(**spec["filter"]).add_rainflow_statistics(m=spec["wohler_exponent"])
+
+    failed+=ds.generate_statistics(parallel=True,processes=processes,timeout=timeout,retries=retries,executor=executor)
+    failed_filepaths={failure.filepath for failure in failed}
+    ds.filelist=FileList([file for file in ds.filelist if str(file.filepath) not in failed_filepaths])
+
+    if ds.filelist:
+        # the daemon is the only writer, the lock only guards against process_one_file jobs on the same database
+        with FileLock(db_file.with_suffix('.lock'), timeout=600):
+            ds.to_sql(str(db_file))
+
+    for file in ds.filelist:
+        file.clear_connections()
+    return failed
+
+def ingest_daemon(directories:list[str],db_file:str="statistics.db",file_format:str="BladedOutFile",fatigue_sensor_spec:list[dict]=None,
+                  poll_interval:float=60,settle_time:float=30,batch_size:int=32,processes:int=None,timeout:float=None,retries:int=None,once:bool=False):
+    """Watch directories for finished runs and ingest them into one loads database
+
+    Replaces one process_one_file job per run: the directories are polled every poll_interval seconds, new runs
+    are processed batch_size at a time in a worker pool that is started once and kept while watching, and each
+    batch is written to the database in one transaction by this process. Runs already in the database are skipped. once processes the finished runs
+    and returns instead of watching. A batch that cannot be processed or written, e.g. because the database is
+    locked, is logged and its files are retried at the next poll.
+    """
+    directories=[Path(directory) for directory in directories]
+    for directory in directories:
+        if not directory.is_dir():
+            warnings.warn(f"Directory not found: {directory}", UserWarning)
+    db_file=Path(db_file)
+
+    if file_format not in format_class:
+        raise ValueError(f"Unknown file format: {file_format}. Valid formats are: {list(format_class.keys())}")
+    file_format=format_class[file_format]
+
+    if not fatigue_sensor_spec:
+        fatigue_sensor_spec = file_format.default_fatigue_sensor_spec()
+
+    ingested=ingested_filepaths(db_file)
+    failed={}
+    print(f"Watching {len(directories)} directories, {len(ingested)} files already in {db_file}")
+
+    executor=executors.get_executor("process",processes,timeout=timeout,retries=retries)
+    try:
+        with executor:
+            while True:
+                for directory in directories:
+                    filepaths=find_finished_files(directory,file_format,ingested,failed,settle_time)
+                    for start in range(0,len(filepaths),batch_size):
+                        batch=filepaths[start:start+batch_size]
+                        print(f"Ingesting {len(batch)} files from {directory}")
+                        try:
+                            failures=ingest_batch(directory,batch,db_file,file_format,fatigue_sensor_spec,executor=executor)
+                        except Exception as e:
+                            # e.g. a lock timeout or database error, the files stay pending and are retried at the next poll
+                            print(f"Error ingesting {len(batch)} files from {directory}, retrying at the next poll: {e!r}")
+                            continue
+
+                        failed_filepaths={failure.filepath for failure in failures}
+                        for filepath in batch:
+                            if str(filepath) in failed_filepaths:
+                                try:
+                                    failed[str(filepath)]=filepath.stat().st_mtime
+                                except OSError:
+                                    # the run was deleted
+                                    failed.pop(str(filepath),None)
+                            else:
+                                ingested.add(str(filepath))
+                                failed.pop(str(filepath),None)
+
+                if once:
+                    break
+                time.sleep(poll_interval)
+    except KeyboardInterrupt:
+        print("Stopped watching")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Watch directories for finished runs and ingest them into a loads database."
+    )
+    parser.add_argument(
+        "directories", type=str, nargs="+", help="Directories to watch."
+    )
+    parser.add_argument("-f", "--file-format", type=str, default="BladedOutFile",)
+    parser.add_argument(
+        "-db",
+        "--db-file",
+        type=str,
+        default="statistics.db",
+        help="Path to the loads database file.",
+    )
+    parser.add_argument(
+        "-i",
+        "--poll-interval",
+        type=float,
+        default=60,
+        help="Seconds between scans of the directories.",
+    )
+    parser.add_argument(
+        "--settle-time",
+        type=float,
+        default=30,
+        help="Seconds a run must be unchanged before it is ingested.",
+    )
+    parser.add_argument(
+        "-b",
+        "--batch-size",
+        type=int,
+        default=32,
+        help="Number of files written to the database per transaction.",
+    )
+    parser.add_argument(
+        "-p",
+        "--processes",
+        type=int,
+        default=None,
+        help="Number of worker processes, by default the available CPUs.",
+    )
+    parser.add_argument(
+        "-t",
+        "--timeout",
+        type=float,
+        default=None,
+        help="Seconds a file may take before its worker is killed.",
+    )
+    parser.add_argument(
+        "-r",
+        "--retries",
+        type=int,
+        default=None,
+        help="Number of times a file that times out or crashes its worker is retried.",
+    )
+    parser.add_argument(
+        "--once",
+        action="store_true",
+        help="Ingest the finished runs and exit instead of watching.",
+    )
+
+    args = parser.parse_args()
+
+
+    ingest_daemon(
+        args.directories,
+        args.db_file,
+        file_format=args.file_format,
+        poll_interval=args.poll_interval,
+        settle_time=args.settle_time,
+        batch_size=args.batch_size,
+        processes=args.processes,
+        timeout=args.timeout,
+        retries=args.retries,
+        once=args.once,
+    )
@@ -0,0 +1,70 @@
+from pathlib import Path
+import argparse
+import warnings
+
+from loadex.data.database import merge_databases as merge
+
+
+def find_staged_files(directories: list[str]) -> list[Path]:
+    """Return the staged results databases written by process_one_file --stage in the directories"""
+    return sorted(f for directory in directories for f in Path(directory).rglob("*.loadex.db"))
+
+def merge_databases(db_file: str, shard_files: list[str], staged_directories: list[str]=None, delete_staged: bool=False):
+    """Merge shard databases, e.g. from process_files --shard, into one loads database
+
+    staged_directories adds the staged results of process_one_file --stage found in those directories. These
+    many small databases are merged in one transaction and deleted afterwards if delete_staged.
+    """
+    staged_files=find_staged_files(staged_directories or [])
+    shard_files=[Path(shard_file) for shard_file in shard_files]+staged_files
+    for shard_file in shard_files:
+        if not shard_file.exists():
+            raise FileNotFoundError(f"Shard database not found: {shard_file}")
+
+    if Path(db_file) in shard_files:
+        raise ValueError(f"The merged database {db_file} cannot also be a shard.")
+    if not shard_files:
+        warnings.warn("No shard databases to merge.", UserWarning)
+        return
+
+    merge(str(db_file), [str(shard_file) for shard_file in shard_files], single_transaction=bool(staged_files))
+    print(f"Merged {len(shard_files)} shard databases into {db_file}")
+
+    if delete_staged:
+        for staged_file in staged_files:
+            staged_file.unlink()
+        print(f"Deleted {len(staged_files)} staged databases")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Merge shard loads databases into one loads database."
+    )
+    parser.add_argument(
+        "db_file", type=str, help="Path to the merged loads database file, created if it does not exist."
+    )
+    parser.add_argument(
+        "shard_files", type=str, nargs="*", help="Paths to the shard database files."
+    )
+    parser.add_argument(
+        "--staged",
+        type=str,
+        nargs="+",
+        default=None,
+        help="Directories to search for staged results written by process_one_file --stage.",
+    )
+    parser.add_argument(
+        "--delete-staged",
+        action="store_true",
+        help="Delete the staged results after they are merged.",
+    )
+
+    args = parser.parse_args()
+
+
+    merge_databases(
+        args.db_file,
+        args.shard_files,
+        staged_directories=args.staged,
+        delete_staged=args.delete_staged,
+    )
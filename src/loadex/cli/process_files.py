@@ -12,16 +12,36 @@ def log_file_path(file_path:Path|str)->Path:
         file_path=Path(file_path)
     return file_path.with_suffix('.loadex_log')
 
-def process_files(directory: str,db_file:str=None,file_format:str="BladedOutFile",fatigue_sensor_spec:list[dict]=None):
+def parse_shard(shard:str)->tuple[int,int]:
+    """Parse a shard given as "index/n_shards", e.g. "0/4" for the first of four shards"""
+    try:
+        index,n_shards=(int(part) for part in shard.split("/"))
+    except ValueError:
+        raise ValueError(f"Invalid shard '{shard}'. Must be 'index/n_shards', e.g. '0/4'.")
+    return index,n_shards
+
+def process_files(directory: str,db_file:str=None,file_format:str="BladedOutFile",fatigue_sensor_spec:list[dict]=None,shard:str=None,timeout:float=None,retries:int=None):
+    """Process the files in a directory into a loads database
+
+    shard="index/n_shards" only processes one deterministic shard of the files, by default into its own
+    statistics.shard<index>of<n_shards>.db. Combine the shard databases with loadex.cli.merge_databases.
+    timeout (seconds per file) and retries stop a hung or crashing file from blocking the run, failed files
+    are listed in the log file.
+    """
     directory=Path(directory)
     if not directory.is_dir():
         warnings.warn(f"Directory not found: {directory}", UserWarning)
 
+    if shard is not None:
+        shard_index,n_shards=parse_shard(shard)
+
     log_file= log_file_path(directory)
+    if shard is not None:
+        log_file=log_file.with_suffix(f'.shard{shard_index}of{n_shards}.loadex_log')
     log_file.unlink(missing_ok=True)
     
     if not db_file:
-        db_file="statistics.db"
+        db_file="statistics.db" if shard is None else f"statistics.shard{shard_index}of{n_shards}.db"
     db_file=directory / db_file
 
     if file_format not in format_class:
@@ -31,6 +51,9 @@ def process_files(directory: str,db_file:str=None,file_format:str="BladedOutFile
     ds=DataSet('loadex.cli.process_files: ' +str(directory))
     
     ds.find_files([str(directory)], format=file_format)
+    if shard is not None:
+        ds.filelist=ds.filelist.shard(n_shards,shard_index,root=directory)
+        print(f"Processing shard {shard_index} of {n_shards}: {len(ds.filelist)} files")
     ds.set_sensors()
 
     # Add default fatigue statistics if defined by file format
@@ -40,11 +63,13 @@ def process_files(directory: str,db_file:str=None,file_format:str="BladedOutFile
     for spec in fatigue_sensor_spec:
         ds.sensorlist.get_sensors(**spec["filter"]).add_rainflow_statistics(m=spec["wohler_exponent"])
 
-    ds.generate_statistics(parallel=True)
+    failed=ds.generate_statistics(parallel=True,timeout=timeout,retries=retries)
     ds.to_sql(str(db_file))
 
     with open(log_file,'w') as f:
         f.write(f'Processed {file_format.__name__} files in {directory}, output to {db_file}\n')
+        for failure in failed:
+            f.write(f'Failed: {failure}\n')
 
 
 if __name__ == "__main__":
@@ -62,6 +87,28 @@ if __name__ == "__main__":
         default=None,
         help="Path to the loads database file.",
     )
+    parser.add_argument(
+        "-s",
+        "--shard",
+        type=str,
+        default=None,
+        help="Only process one shard of the files, given as index/n_shards, e.g. 0/4.",
+    )
+
+    parser.add_argument(
+        "-t",
+        "--timeout",
+        type=float,
+        default=None,
+        help="Seconds a file may take before its worker is killed.",
+    )
+    parser.add_argument(
+        "-r",
+        "--retries",
+        type=int,
+        default=None,
+        help="Number of times a file that times out or crashes its worker is retried.",
+    )
 
     args = parser.parse_args()
 
@@ -70,5 +117,8 @@ if __name__ == "__main__":
         args.directory,
         args.db_file,
         file_format=args.file_format,
+        shard=args.shard,
+        timeout=args.timeout,
+        retries=args.retries,
     )
 
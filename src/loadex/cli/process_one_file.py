@@ -15,11 +15,24 @@ def log_file_path(file_path:Path|str)->Path:
         file_path=Path(file_path)
     return file_path.with_suffix('.loadex_log')
 
+def staged_file_path(file_path:Path|str)->Path:
+    """Return the path of the staged results database written next to a file by process_one_file(stage=True)"""
+    if isinstance(file_path,str):
+        file_path=Path(file_path)
+    return file_path.with_suffix('.loadex.db')
+
 def status_to_logfile(progress:int, message:str, log_file:Path):
     with open(log_file,'w') as f:
         f.write(f'{progress}%\t{message}\n')
 
-def process_one_file(file_path: str,db_file:str=None,file_format:str="BladedOutFile",fatigue_sensor_spec:list[dict]=None,update_log:callable=None):
+def process_one_file(file_path: str,db_file:str=None,file_format:str="BladedOutFile",fatigue_sensor_spec:list[dict]=None,update_log:callable=None,sensor_workers:int=None,sensor_executor:str=None,stage:bool=False):
+    """Process one file into a loads database
+
+    sensor_workers spreads the sensors of the file over a "thread" or "process" sensor_executor, by default
+    processes for Bladed files and threads for other formats.
+    stage writes the results to a database next to the file (see staged_file_path) instead of taking the
+    lock on db_file, to be merged later with loadex.cli.merge_databases --staged.
+    """
     file_path=Path(file_path)
     if not file_path.exists():
         warnings.warn(f"File not found: {file_path}", UserWarning)
@@ -55,12 +68,21 @@ def process_one_file(file_path: str,db_file:str=None,file_format:str="BladedOutF
 
 
         update_log(25, f'Generating Statistics')
-        ds.generate_statistics(parallel=False)
+        ds.generate_statistics(parallel=False,sensor_workers=sensor_workers,sensor_executor=sensor_executor)
     
-        update_log(50, f'Waiting for database lock')
-        with FileLock(db_file.with_suffix('.lock'), timeout=600):
-            update_log(75, f'Writing to database')
-            ds.to_sql(str(db_file))
+        if stage:
+            # written under a temporary name so a merge never reads a partial staged file
+            staged_file=staged_file_path(file_path)
+            partial_file=staged_file.with_suffix('.partial')
+            partial_file.unlink(missing_ok=True)
+            update_log(75, f'Writing staged results')
+            ds.to_sql(str(partial_file))
+            partial_file.replace(staged_file)
+        else:
+            update_log(50, f'Waiting for database lock')
+            with FileLock(db_file.with_suffix('.lock'), timeout=600):
+                update_log(75, f'Writing to database')
+                ds.to_sql(str(db_file))
     
         update_log(100, f'Finished processing file')
     
@@ -105,6 +127,26 @@ if __name__ == "__main__":
         help="Path to the loads database file.",
     )
 
+    parser.add_argument(
+        "-w",
+        "--sensor-workers",
+        type=int,
+        default=None,
+        help="Number of workers to spread the sensors of the file over.",
+    )
+    parser.add_argument(
+        "--sensor-executor",
+        type=str,
+        default=None,
+        choices=["thread", "process"],
+        help="Run the sensor workers as threads or processes. Defaults to processes for Bladed files, threads otherwise.",
+    )
+    parser.add_argument(
+        "--stage",
+        action="store_true",
+        help="Write the results next to the file instead of to the database, to merge later with merge_databases --staged.",
+    )
+
     args = parser.parse_args()
 
 
@@ -112,5 +154,8 @@ if __name__ == "__main__":
         args.file,
         args.db_file,
         file_format=args.file_format,
+        sensor_workers=args.sensor_workers,
+        sensor_executor=args.sensor_executor,
+        stage=args.stage,
     )
 
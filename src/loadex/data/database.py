@@ -1,4 +1,7 @@
 import os
+import shutil
+import sqlite3
+import tempfile
 from sqlalchemy import create_engine, event, inspect, text
 from sqlalchemy.orm import sessionmaker
 from loadex.data.datamodel import Base, File,DesignLoadCase,VirtualSensorInputs
@@ -63,4 +66,109 @@ def add_column_if_missing(engine, table_name, column_name, column_type):
     if column_name not in columns:
         with engine.connect() as conn:
             conn.execute(text(f"ALTER TABLE {table_name} ADD COLUMN '{column_name}' {column_type}"))
-            conn.commit()
\ No newline at end of file
+            conn.commit()
+
+
+def merge_databases(db_path, shard_paths:list, single_transaction:bool=False):
+    """Merge shard databases into a database, creating it if it does not exist
+
+    Each shard is attached and copied with INSERT ... SELECT. DLCs, sensors and statistic types are matched
+    by name and files by filepath, and the ids of the shard rows are remapped to the ids in the database.
+    Files already in the database are replaced, as in DataSet.to_sql.
+
+    Each shard is merged in its own transaction. With single_transaction, e.g. for many small staged
+    databases, the shards are first combined in a temporary database that is merged in one transaction.
+    SQLite cannot detach a database within a transaction, so the shards cannot all be attached in one.
+    """
+    if single_transaction and len(shard_paths)>1:
+        temp_dir=tempfile.mkdtemp(prefix="loadex_merge_")
+        try:
+            combined_path=os.path.join(temp_dir, "combined.db")
+            merge_databases(combined_path, shard_paths)
+            merge_databases(db_path, [combined_path])
+        finally:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+        return
+
+    # create or migrate the schema of all databases
+    for path, create in [(db_path, True)] + [(path, False) for path in shard_paths]:
+        Session = get_sqlite_session(path, create_if_not_exists=create)
+        with Session() as session:
+            engine = session.get_bind()
+        engine.dispose()
+
+    conn = sqlite3.connect(db_path, timeout=timeout, isolation_level=None)
+    try:
+        conn.execute(f"PRAGMA busy_timeout={timeout*1000}")
+        conn.execute("PRAGMA foreign_keys=ON")
+        for shard_path in shard_paths:
+            print(f"Merging {shard_path} into {db_path}")
+            conn.execute("ATTACH DATABASE ? AS shard", (str(shard_path),))
+            try:
+                # one transaction per shard
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    _merge_attached_shard(conn)
+                    conn.execute("COMMIT")
+                except Exception:
+                    conn.execute("ROLLBACK")
+                    raise
+            finally:
+                conn.execute("DETACH DATABASE shard")
+    finally:
+        conn.close()
+
+def _merge_attached_shard(conn):
+    """Copy the database attached as shard into the main database, in the current transaction"""
+    # named rows, new names only
+    conn.execute("""INSERT INTO main.designloadcases (name, type, psf)
+        SELECT name, type, psf FROM shard.designloadcases WHERE name NOT IN (SELECT name FROM main.designloadcases)""")
+    conn.execute("""INSERT INTO main.statistictypes (name, python_class, python_params)
+        SELECT name, python_class, python_params FROM shard.statistictypes WHERE name NOT IN (SELECT name FROM main.statistictypes)""")
+
+    conn.execute("CREATE TEMP TABLE new_sensors AS SELECT id FROM shard.sensors WHERE name NOT IN (SELECT name FROM main.sensors)")
+    conn.execute("""INSERT INTO main.sensors (name, is_virtual, function)
+        SELECT name, is_virtual, function FROM shard.sensors WHERE id IN (SELECT id FROM temp.new_sensors)""")
+
+    # replace overlapping files, cascading to their statistics and attributes
+    conn.execute("DELETE FROM main.files WHERE filepath IN (SELECT filepath FROM shard.files)")
+    conn.execute("""INSERT INTO main.files (filepath, type, "group", hours, dlc_id)
+        SELECT f.filepath, f.type, f."group", f.hours, md.id FROM shard.files f
+        LEFT JOIN shard.designloadcases sd ON f.dlc_id = sd.id
+        LEFT JOIN main.designloadcases md ON md.name = sd.name""")
+
+    # shard id -> database id
+    conn.execute("""CREATE TEMP TABLE file_map AS
+        SELECT s.id AS old_id, m.id AS new_id FROM shard.files s JOIN main.files m ON m.filepath = s.filepath""")
+    conn.execute("""CREATE TEMP TABLE sensor_map AS
+        SELECT s.id AS old_id, m.id AS new_id FROM shard.sensors s JOIN main.sensors m ON m.name = s.name""")
+    conn.execute("""CREATE TEMP TABLE type_map AS
+        SELECT s.id AS old_id, m.id AS new_id FROM shard.statistictypes s JOIN main.statistictypes m ON m.name = s.name""")
+    for table in ["file_map", "sensor_map", "type_map"]:
+        conn.execute(f"CREATE UNIQUE INDEX temp.ix_{table} ON {table} (old_id)")
+
+    conn.execute("""INSERT INTO main.fileattributes (file_id, key, value)
+        SELECT fm.new_id, a.key, a.value FROM shard.fileattributes a JOIN temp.file_map fm ON a.file_id = fm.old_id""")
+
+    # attributes and inputs of sensors that were new to the database
+    conn.execute("""INSERT INTO main.sensorattributes (sensor_id, key, value)
+        SELECT sm.new_id, a.key, a.value FROM shard.sensorattributes a JOIN temp.sensor_map sm ON a.sensor_id = sm.old_id
+        WHERE a.sensor_id IN (SELECT id FROM temp.new_sensors)""")
+    conn.execute("""INSERT INTO main.virtualsensorinputs (virtual_sensor_id, input_name, input_sensor_id)
+        SELECT vm.new_id, v.input_name, im.new_id FROM shard.virtualsensorinputs v
+        JOIN temp.sensor_map vm ON v.virtual_sensor_id = vm.old_id
+        JOIN temp.sensor_map im ON v.input_sensor_id = im.old_id
+        WHERE v.virtual_sensor_id IN (SELECT id FROM temp.new_sensors)""")
+
+    conn.execute("""INSERT INTO main.standardstatistics (file_id, sensor_id, mean, max, min, std)
+        SELECT fm.new_id, sm.new_id, s.mean, s.max, s.min, s.std FROM shard.standardstatistics s
+        JOIN temp.file_map fm ON s.file_id = fm.old_id
+        JOIN temp.sensor_map sm ON s.sensor_id = sm.old_id""")
+    conn.execute("""INSERT INTO main.customstatistics (file_id, sensor_id, statistic_type_id, value)
+        SELECT fm.new_id, sm.new_id, tm.new_id, s.value FROM shard.customstatistics s
+        JOIN temp.file_map fm ON s.file_id = fm.old_id
+        JOIN temp.sensor_map sm ON s.sensor_id = sm.old_id
+        JOIN temp.type_map tm ON s.statistic_type_id = tm.old_id""")
+
+    for table in ["new_sensors", "file_map", "sensor_map", "type_map"]:
+        conn.execute(f"DROP TABLE temp.{table}")
@@ -1,8 +1,25 @@
 from loadex.classes.filelist import File
+from loadex.formats import header_index, timeseries_cache
+from loadex.formats.timeseries_cache import TimeseriesCache
 import dnv_bladed_results as bd
+import numpy as np
 import pandas as pd
 from pathlib import Path
+import glob
 import json
+import os
+import re
+import threading
+import weakref
+from collections import OrderedDict
+from types import SimpleNamespace
+
+# Bladed output files are <run>.$XX and <run>.%XX, e.g. .$TE, .$PJ, .%41 and .$41
+_output_extension=re.compile(r"\.[$%][0-9A-Z]{2}",re.IGNORECASE)
+
+def is_output_extension(suffix:str)->bool:
+    """Return whether a suffix is that of a Bladed output file, excluding files written by loadex next to the run"""
+    return _output_extension.fullmatch(suffix) is not None
 
 def flatten_dict(d, parent_key='', sep='.')->dict:
     items = {}
@@ -21,6 +38,12 @@ def flatten_dict(d, parent_key='', sep='.')->dict:
 class BladedOutFile(File):
     """Contains a Bladed .out file from a loads dataset"""
 
+    # the Bladed results API is not documented as thread-safe, so sensor_workers reopen the run in processes
+    sensor_executor = "process"
+
+    # number of groups whose 2D blocks are kept, see _read_block
+    block_cache_size = 2
+
     def __init__(self, filepath: str,metadata:dict=None):
         filepath=Path(filepath)
         if filepath.name.lower()=="dtbladed.in":
@@ -35,7 +58,28 @@ class BladedOutFile(File):
         super().__init__(filepath,metadata)
         self._run = None
         self._sensors = None
+        self._cache = None
+        # 2D blocks by group and variable name, the lock lets the sensor threads of a file share them
+        self._blocks = OrderedDict()
+        self._block_lock = threading.Lock()
+        self._variables = {}
+        # kept after clear_connections, so later reads in this process do not reopen the run for them; process
+        # workers open the file from its path and read them again
+        self._time_axis = None
+        self._time_values = None
+        self._summary = None
+        self._layout = None
     
+    def __getstate__(self):
+        # locks cannot be pickled, the unpickled file gets a new one
+        state=self.__dict__.copy()
+        del state["_block_lock"]
+        return state
+
+    def __setstate__(self,state):
+        self.__dict__.update(state)
+        self._block_lock=threading.Lock()
+
     def __del__(self):
         self.clear_connections()
         bd.ResultsApi.clear_runs()
@@ -75,6 +119,58 @@ class BladedOutFile(File):
         sensor=self.sensors.get(sensor_name)
         return sensor.metadata
 
+    # lazy load of data
+    @property
+    def cache(self) -> TimeseriesCache:
+        """Memory-mapped time series of the run, built on first access, or None unless timeseries_cache.enable was called"""
+        if self._cache is None and timeseries_cache.cache_directory() is not None:
+            key=timeseries_cache.source_key(self._output_files())
+            self._cache=TimeseriesCache.open(self.filepath,key)
+            if self._cache is None:
+                print(f"Caching time series of {self.filepath}")
+                self._cache=TimeseriesCache.build(self.filepath,key,self._read_time(),self.sensor_names,self._read_data)
+        return self._cache
+
+    def _output_files(self) -> list[Path]:
+        """Return the Bladed output files of the run, e.g. run.$TE, run.%41 and run.$41, without files written by loadex"""
+        outputs=self.filepath.parent.glob(glob.escape(self.filepath.stem) + ".*")
+        return [f for f in outputs if is_output_extension(f.suffix) and f.is_file()]
+
+    def estimated_cost(self) -> float:
+        """Return the size of the output files of the run, which scales with the data points x sensors
+
+        The run is not opened, so the cost of many runs can be estimated before they are submitted.
+        """
+        return self.estimated_costs([self])[0]
+
+    @classmethod
+    def estimated_costs(cls,files:list["BladedOutFile"]) -> list[float]:
+        """Return the estimated_cost of each run, listing each directory once instead of once per run"""
+        sizes={}
+        for directory in {file.filepath.parent for file in files}:
+            try:
+                entries=list(os.scandir(directory))
+            except OSError:
+                continue
+            for entry in entries:
+                stem,suffix=os.path.splitext(entry.name)
+                if is_output_extension(suffix) and entry.is_file():
+                    key=(directory,stem)
+                    sizes[key]=sizes.get(key,0)+entry.stat().st_size
+        return [float(sizes.get((file.filepath.parent,file.filepath.stem),0)) for file in files]
+
+    @property
+    def summary(self) -> dict:
+        """Simulation length, output start time and output timestep from the Summary information group"""
+        if self._summary is None:
+            group=self.run.get_group('Summary information')
+            self._summary={
+                "time_domain_simulation_length":group.time_domain_simulation_length,
+                "time_domain_simulation_output_start_time":group.time_domain_simulation_output_start_time,
+                "time_domain_simulation_output_timestep":group.time_domain_simulation_output_timestep,
+            }
+        return self._summary
+
     def add_json_metadata(self):
         
         jsonfile=self.filepath.parent / (self.filepath.stem + ".metadata.json")
@@ -100,10 +196,7 @@ class BladedOutFile(File):
         self.metadata["completion_state"]=self.run.completion_state
         self.metadata["run_at_timestamp"]=self.run.timestamp
 
-        group=self.run.get_group('Summary information')
-        self.metadata["time_domain_simulation_length"]=group.time_domain_simulation_length
-        self.metadata["time_domain_simulation_output_start_time"]=group.time_domain_simulation_output_start_time
-        self.metadata["time_domain_simulation_output_timestep"]=group.time_domain_simulation_output_timestep
+        self.metadata.update(self.summary)
         try:
             self.metadata["execution_duration_seconds"]=self.run.execution_duration_seconds
         except RuntimeError as e:
@@ -122,8 +215,12 @@ class BladedOutFile(File):
         self.add_json_metadata()
 
     def clear_connections(self):
+        super().clear_connections()
         self._run = None
         self._sensors = None
+        self._cache = None
+        self._blocks = OrderedDict()
+        self._variables = {}
 
     def to_dataframe(self) -> pd.DataFrame:
         pass
@@ -135,19 +232,117 @@ class BladedOutFile(File):
             data[sensor_name] = self.get_data(sensor_name)
         return pd.DataFrame(data)
 
-    def get_time(self) -> pd.Series:
+    def get_time(self,time_range:tuple[float,float]=None) -> pd.Series:
+        # the time vector read is a new array and the memory map is read-only, so neither is copied
+        cached=self._time_axis is None and self._time_values is None and self.cache is not None
+        time=self.cache.time if cached else self._read_time()
+        if time_range is not None:
+            time=time[self.time_range_slice(time,time_range)]
+        return pd.Series(time,copy=False)
+
+    def _read_time(self) -> np.ndarray:
+        """Return the time vector, read from the run once and then rebuilt from its start, step and count
+
+        The start and step are the output start time and timestep of the summary, or else the first value and
+        spacing of the time vector. A time vector that is not evenly spaced is kept as read.
+        """
+        if self._time_axis is not None:
+            start,step,count=self._time_axis
+            return start+step*np.arange(count)
+        if self._time_values is not None:
+            return self._time_values.copy()
+
         ivar=self.run.get_group('Summary information').get_independent_variable(0)
         if ivar.name!="Time":
             raise ValueError("Time variable not found in file.")
-        return pd.Series(ivar.get_values_as_number())
+        time=np.asarray(ivar.get_values_as_number(),dtype=float)
+
+        count=len(time)
+        axes=[(self.summary["time_domain_simulation_output_start_time"],self.summary["time_domain_simulation_output_timestep"])]
+        if count>1:
+            axes.append((time[0],(time[-1]-time[0])/(count-1)))
+        for start,step in axes:
+            rebuilt=start+step*np.arange(count)
+            # the time values may be stored in single precision
+            if step>0 and np.allclose(rebuilt,time,rtol=0,atol=step*1e-2):
+                self._time_axis=(start,step,count)
+                return rebuilt
+        self._time_values=time
+        return time.copy()
     
-    def get_data(self,sensor_name) -> pd.Series:
+    def get_data(self,sensor_name,time_range:tuple[float,float]=None) -> pd.Series:
+        """Return the timeseries of a sensor
+
+        With the cache enabled, a time_range is read as a slice of the memory map. Otherwise the Bladed API reads
+        the whole sensor and the range is sliced afterwards.
+        """
+        if self.cache is not None and sensor_name in self.cache:
+            data=self.cache.get_data(sensor_name)
+            if time_range is not None:
+                data=data[self.time_range_slice(self.cache.time,time_range)]
+            return pd.Series(data,copy=False)
+        data=self._read_data(sensor_name)
+        if time_range is not None:
+            data=data[self.time_range_slice(self._read_time(),time_range)]
+        return pd.Series(data)
+
+    def _read_data(self,sensor_name):
         sensor=self.sensors.get(sensor_name)
-        return pd.Series(sensor.get_data())
+        if isinstance(sensor,Bladed2DSensor) and sensor.independent_variable_index is not None:
+            return self._read_block(sensor.variable)[:,sensor.independent_variable_index]
+        return sensor.get_data()
+
+    def _read_block(self,variable) -> np.ndarray:
+        """Return all values of a 2D variable as a (time x independent variable values) array, read in one call
+
+        The blocks of the last block_cache_size groups read are kept until clear_connections, so the sensors of a
+        group are served as columns of its blocks instead of one get_data_at_value call per value. Threads reading
+        the sensors of the file wait for a block being read instead of reading it again.
+        """
+        with self._block_lock:
+            group_name=variable.parent_group_name
+            blocks=self._blocks.setdefault(group_name,{})
+            self._blocks.move_to_end(group_name)
+            while len(self._blocks)>self.block_cache_size:
+                self._blocks.popitem(last=False)
+            if variable.name not in blocks:
+                # get_data returns the time series at each independent variable value
+                blocks[variable.name]=np.stack(variable.get_data(),axis=1)
+            return blocks[variable.name]
 
-    def _initialize_sensor_list(self):
-        sensors = []
-        Ntime=len(self.get_time())
+    @property
+    def reads_chunks(self) -> bool:
+        """Chunks are slices of the time series cache, without it the Bladed API reads whole sensors"""
+        return self.cache is not None
+
+    def get_data_chunks(self, sensor_names: list[str], chunk_size: int):
+        """Yield the data of the sensors in chunks of chunk_size samples, as slices of the cache if enabled"""
+        if self.cache is None or not all(name in self.cache for name in sensor_names):
+            yield from super().get_data_chunks(sensor_names, chunk_size)
+            return
+        for start in range(0, len(self.cache.time), chunk_size):
+            yield self.cache.get_block(sensor_names, start, start+chunk_size)
+
+    @property
+    def layout(self) -> dict:
+        """The time series groups of the run with their variables and independent variable values
+
+        Read from the header index if enabled, otherwise by walking the groups of the run. Kept after clear_connections.
+        """
+        if self._layout is None:
+            key=None
+            if header_index.index_directory() is not None:
+                key=header_index.layout_key(self.filepath,self._output_files())
+                self._layout=header_index.load(key)
+            if self._layout is None:
+                self._layout=self._read_layout()
+                if key is not None:
+                    header_index.save(key,self._layout)
+        return self._layout
+
+    def _read_layout(self) -> dict:
+        layout_groups=[]
+        Ntime=len(self._read_time())
         groups = self.run.get_groups()
         groups = sorted(groups, key=lambda o: o.number)
         for group in groups:
@@ -155,26 +350,63 @@ class BladedOutFile(File):
                 continue # only time variables are supported and constant time vector length
 
             if group.is_one_dimensional:
-                for variable in group.get_variables_1d():
-                    sensors.append(Bladed1DSensor(variable))
+                variables=group.get_variables_1d()
+                layout_group={"name":group.name}
             
             elif group.is_two_dimensional:
                 independent_variable=group.get_independent_variable(bd.INDEPENDENT_VARIABLE_ID_SECONDARY)
-                independent_variable_values=independent_variable.get_values_as_string()
                 
                 independent_variable_numeric=None
                 if independent_variable.has_numeric_values:
-                    independent_variable_numeric=independent_variable.get_values_as_number()
+                    independent_variable_numeric=[float(value) for value in independent_variable.get_values_as_number()]
+
+                variables=group.get_variables_2d()
+                layout_group={"name":group.name,
+                              "independent_variable":{"name":independent_variable.name,
+                                                      "unit":independent_variable.si_unit,
+                                                      "values":list(independent_variable.get_values_as_string()),
+                                                      "numeric":independent_variable_numeric}}
+            else:
+                continue
+
+            layout_group["variables"]=[]
+            for variable in variables:
+                self._variables[(group.name,variable.name)]=variable
+                layout_group["variables"].append({"name":variable.name,"group_name":variable.parent_group_name,"unit":variable.si_unit})
+            layout_groups.append(layout_group)
+
+        return {"groups":layout_groups}
+
+    def _get_variable(self,group_name:str,variable_name:str,two_dimensional:bool):
+        """Return a variable of the run, looking up all variables of its group at once"""
+        key=(group_name,variable_name)
+        if key not in self._variables:
+            group=self.run.get_group(group_name)
+            variables=group.get_variables_2d() if two_dimensional else group.get_variables_1d()
+            for variable in variables:
+                self._variables[(group_name,variable.name)]=variable
+        return self._variables[key]
 
-                dependent_variables=group.get_variables_2d()
-                for i,independent_variable_value in enumerate(independent_variable_values):
-                    for variable in dependent_variables:
+    def _initialize_sensor_list(self):
+        sensors = []
+        for group in self.layout["groups"]:
+            independent_variable=group.get("independent_variable")
+            variables=[HeaderVariable(self,group,variable) for variable in group["variables"]]
+
+            if independent_variable is None:
+                for variable in variables:
+                    sensors.append(Bladed1DSensor(variable))
+            
+            else:
+                independent_variable_numeric=independent_variable["numeric"]
+                for i,independent_variable_value in enumerate(independent_variable["values"]):
+                    for variable in variables:
 
                         numeric_value=None
                         if independent_variable_numeric is not None:
                             numeric_value=independent_variable_numeric[i]
 
-                        sensors.append(Bladed2DSensor(variable,independent_variable_value,numeric_value))
+                        sensors.append(Bladed2DSensor(variable,independent_variable_value,numeric_value,i))
 
         self._sensors=SensorList(sensors)
 
@@ -243,6 +475,44 @@ class SensorList(list):
             })
         return pd.DataFrame(rows)
     
+class HeaderVariable(object):
+    """A variable of a run described by the layout of the run, looked up in the Bladed API when its data is read
+
+    The file is referenced weakly, so the sensors of a file do not keep it alive and its run is still released
+    when it is deleted.
+    """
+    def __init__(self,file:BladedOutFile,group:dict,header:dict):
+        self._file=weakref.ref(file)
+        self.group_name=group["name"]
+        self.name=header["name"]
+        self.parent_group_name=header["group_name"]
+        self.si_unit=header["unit"]
+        self._independent_variable=None
+        if "independent_variable" in group:
+            self._independent_variable=SimpleNamespace(name=group["independent_variable"]["name"],si_unit=group["independent_variable"]["unit"])
+
+    @property
+    def file(self) -> BladedOutFile:
+        file=self._file()
+        if file is None:
+            raise ValueError(f"The file of variable {self.name} was deleted.")
+        return file
+
+    @property
+    def variable(self):
+        return self.file._get_variable(self.group_name,self.name,self._independent_variable is not None)
+
+    def get_independent_variable(self,independent_variable_id):
+        if independent_variable_id==bd.INDEPENDENT_VARIABLE_ID_SECONDARY and self._independent_variable is not None:
+            return self._independent_variable
+        return self.variable.get_independent_variable(independent_variable_id)
+
+    def get_data(self):
+        return self.variable.get_data()
+
+    def get_data_at_value(self,value):
+        return self.variable.get_data_at_value(value)
+
 class BladedSensor(object):
     def __init__(self,variable):
         self.variable=variable
@@ -282,10 +552,11 @@ class Bladed1DSensor(BladedSensor):
         return self.variable.get_data()
     
 class Bladed2DSensor(BladedSensor):
-    def __init__(self,variable,independent_variable_value,independent_variable_numeric=None):
+    def __init__(self,variable,independent_variable_value,independent_variable_numeric=None,independent_variable_index=None):
         super().__init__(variable)
         self.independent_variable_value=independent_variable_value
         self.independent_variable_numeric=independent_variable_numeric
+        self.independent_variable_index=independent_variable_index
 
     @property
     def name(self):
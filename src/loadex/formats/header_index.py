@@ -0,0 +1,91 @@
+"""Opt-in persistent index of the sensor headers of Bladed runs
+
+After enable(directory), BladedOutFile saves the groups, variables and independent variable values of a run to
+the directory the first time its sensors are listed, and later builds its sensors from the index without walking
+the groups through the Bladed API. Runs whose header files describe the same layout share one index entry, so a
+dataset of runs with the same outputs is walked once. The directory is passed through an environment variable so
+worker processes use the same index.
+"""
+import hashlib
+import json
+import os
+from pathlib import Path
+
+from loadex.formats.timeseries_cache import source_key
+
+ENVIRONMENT_VARIABLE = "LOADEX_HEADER_INDEX"
+
+
+def enable(directory: str):
+    """Index sensor headers in directory, including in worker processes started afterwards"""
+    directory = Path(directory).resolve()
+    directory.mkdir(parents=True, exist_ok=True)
+    os.environ[ENVIRONMENT_VARIABLE] = str(directory)
+
+
+def disable():
+    os.environ.pop(ENVIRONMENT_VARIABLE, None)
+
+
+def index_directory() -> Path:
+    """Return the index directory, or None if the index is not enabled"""
+    directory = os.environ.get(ENVIRONMENT_VARIABLE)
+    if not directory:
+        return None
+    return Path(directory)
+
+
+# header records that describe the groups, variables and independent variables, unlike e.g. FILE, CONTENT and
+# the ULOADS, MAXTIME, MINTIME and MEAN results of the run
+LAYOUT_RECORDS = {b"GENLAB", b"VARIAB", b"VARUNIT", b"AXISLAB", b"AXIUNIT", b"AXIVAL", b"AXITICK", b"NDIMENS", b"DIMENS"}
+# records that give the values of an axis by its method, start and step; part of the layout for axes other than
+# time, whose start and step are read from the run when its time vector is read
+AXIS_VALUE_RECORDS = {b"AXIMETH", b"MIN", b"STEP"}
+
+
+def layout_key(filepath: Path, output_files: list[Path]) -> str:
+    """Return the key of the sensor layout of a run
+
+    The key is a hash of the layout records of the Bladed header files (.%NN), so runs with the same groups,
+    variables, dimensions and station values share a key. Without header files it is a hash of the path, size and modification
+    time of the run.
+    """
+    digest = hashlib.sha1()
+    headers = sorted((path for path in output_files if path.suffix.startswith(".%")), key=lambda path: path.suffix)
+    if headers:
+        for path in headers:
+            digest.update(path.suffix.encode())
+            record = None
+            time_axis = False
+            with open(path, "rb") as f:
+                for line in f:
+                    # indented lines continue the record of the line before
+                    if line[:1] not in (b" ", b"\t"):
+                        words = line.split(maxsplit=1)
+                        record = words[0].upper() if words else None
+                        if record == b"AXISLAB":
+                            time_axis = len(words) > 1 and words[1].strip().strip(b"'\"").upper() == b"TIME"
+                    if record in LAYOUT_RECORDS or (record in AXIS_VALUE_RECORDS and not time_axis):
+                        digest.update(b" ".join(line.split()) + b"\n")
+    else:
+        digest.update(str(Path(filepath).resolve()).encode())
+        digest.update(json.dumps(source_key(output_files)).encode())
+    return digest.hexdigest()
+
+
+def load(key: str) -> dict:
+    """Return the indexed layout of a key, or None if it is not indexed"""
+    try:
+        with open(index_directory() / f"{key}.json", "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def save(key: str, layout: dict):
+    """Save a layout under a temporary name first, so a partially written index is never loaded"""
+    path = index_directory() / f"{key}.json"
+    temp_path = path.with_name(f"{key}.{os.getpid()}.tmp")
+    with open(temp_path, "w") as f:
+        json.dump(layout, f)
+    os.replace(temp_path, path)
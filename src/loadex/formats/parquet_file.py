@@ -1,33 +1,114 @@
+from collections import OrderedDict
+
 from loadex.classes.filelist import File
+import numpy as np
 import pandas as pd
+import pyarrow.parquet as pq
 
 
 class ParquetFile(File):
-    """Contains a Parquet .parquet file from a loads dataset"""
+    """Contains a Parquet .parquet file from a loads dataset
+
+    Only the schema is read until data is requested. Columns are then read one at a time and the last
+    column_cache_size decoded columns are kept.
+    """
+
+    column_cache_size = 32
 
-    def __init__(self, filepath: str,metadata:dict=dict()):
+    def __init__(self, filepath: str,metadata:dict=None):
         super().__init__(filepath,metadata)
-        self.data=pd.read_parquet(self.filepath)
+        self._schema=None
+        self._sensor_names=None
+        self._columns=OrderedDict()
 
     @staticmethod
     def defaultExtensions():
         return ["parquet",]
-    
+
+    # lazy load of schema
+    @property
+    def schema(self):
+        if self._schema is None:
+            self._schema=pq.read_schema(self.filepath)
+        return self._schema
+
+    @property
+    def data(self) -> pd.DataFrame:
+        """All columns of the file, read on each access"""
+        return pd.read_parquet(self.filepath)
+
     @property
     def sensor_names(self):
-        return self.data.columns.tolist()
-    
+        if self._sensor_names is None:
+            # stored pandas index columns are not sensors
+            pandas_metadata=self.schema.pandas_metadata or {}
+            index_columns={column for column in pandas_metadata.get("index_columns",[]) if isinstance(column,str)}
+            self._sensor_names=[name for name in self.schema.names if name not in index_columns]
+        return self._sensor_names
+
     def to_dataframe(self) -> pd.DataFrame:
         """Return the data as a DataFrame"""
         return self.data
 
-    def get_time(self) -> pd.Series:
-        for col in self.data.columns:
+    def _read_column(self,name:str) -> pd.Series:
+        """Return a column, from the cache of decoded columns if it was read recently"""
+        try:
+            column=self._columns[name]
+            self._columns.move_to_end(name)
+            return column
+        except KeyError:
+            pass
+
+        column=pd.read_parquet(self.filepath,columns=[name])[name]
+        self._columns[name]=column
+        while len(self._columns)>self.column_cache_size:
+            self._columns.popitem(last=False)
+        return column
+
+    @property
+    def time_name(self) -> str:
+        """Name of the time column"""
+        for col in self.sensor_names:
             if col.lower().startswith("time"):
-                return self.data[col]
+                return col
         raise ValueError("No time column found")
-    
-    def get_data(self,sensor_name) -> pd.Series:
-        return self.data[sensor_name]
 
+    def _read_time_range(self,name:str,time_range:tuple[float,float]) -> pd.Series:
+        """Return the rows of a column within time_range
+
+        A column already in the cache is sliced. Otherwise the time range is pushed down to pyarrow as a filter,
+        so row groups whose time statistics lie outside the range are not read.
+        """
+        if name in self._columns and self.time_name in self._columns:
+            time=self._columns[self.time_name].to_numpy()
+            return self._columns[name].iloc[self.time_range_slice(time,time_range)].reset_index(drop=True)
+        filters=[(self.time_name,">=",time_range[0]),(self.time_name,"<=",time_range[1])]
+        return pd.read_parquet(self.filepath,columns=[name],filters=filters)[name].reset_index(drop=True)
+
+    def get_time(self,time_range:tuple[float,float]=None) -> pd.Series:
+        if time_range is not None:
+            return self._read_time_range(self.time_name,time_range)
+        return self._read_column(self.time_name)
+
+    def get_data(self,sensor_name,time_range:tuple[float,float]=None) -> pd.Series:
+        if sensor_name not in self.sensor_names:
+            raise KeyError(sensor_name)
+        if time_range is not None:
+            return self._read_time_range(sensor_name,time_range)
+        return self._read_column(sensor_name)
+
+    @property
+    def reads_chunks(self) -> bool:
+        return True
+
+    def get_data_chunks(self, sensor_names: list[str], chunk_size: int):
+        """Yield the sensors as (time x sensors) arrays read chunk_size rows at a time, without reading whole columns"""
+        for batch in pq.ParquetFile(self.filepath).iter_batches(batch_size=chunk_size, columns=sensor_names):
+            chunk=np.empty((batch.num_rows, len(sensor_names)))
+            for i, name in enumerate(sensor_names):
+                chunk[:, i]=batch.column(name).to_numpy(zero_copy_only=False)
+            yield chunk
 
+    def clear_connections(self):
+        super().clear_connections()
+        self._columns=OrderedDict()
@@ -0,0 +1,148 @@
+"""Opt-in memory-mapped cache of the time series of result files
+
+After enable(directory), formats that support the cache (BladedOutFile) convert a run on first access to a
+sensor-major .npy array in the directory and read later sensors and time chunks as slices of a memory map.
+The directory is passed through an environment variable so worker processes use the same cache. A cached
+run is rebuilt when the size or modification time of its source files changes. The arrays of each version are
+written under a name of their own, as a memory-mapped file cannot be replaced on Windows while another process
+has it open, and older versions are removed once no longer in use.
+"""
+import glob
+import hashlib
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+
+ENVIRONMENT_VARIABLE = "LOADEX_TIMESERIES_CACHE"
+
+
+def enable(directory: str):
+    """Cache time series in directory, including in worker processes started afterwards"""
+    directory = Path(directory).resolve()
+    directory.mkdir(parents=True, exist_ok=True)
+    os.environ[ENVIRONMENT_VARIABLE] = str(directory)
+
+
+def disable():
+    os.environ.pop(ENVIRONMENT_VARIABLE, None)
+
+
+def cache_directory() -> Path:
+    """Return the cache directory, or None if the cache is not enabled"""
+    directory = os.environ.get(ENVIRONMENT_VARIABLE)
+    if not directory:
+        return None
+    return Path(directory)
+
+
+def source_key(paths: list[Path]) -> dict:
+    """Return the total size and latest modification time of the source files of a cached file"""
+    stats = [path.stat() for path in paths]
+    return {"size": sum(stat.st_size for stat in stats), "mtime_ns": max((stat.st_mtime_ns for stat in stats), default=0)}
+
+
+class TimeseriesCache(object):
+    """The time series of one file as a (sensors x time) array and a time vector, read through memory maps"""
+
+    def __init__(self, base: Path, index: dict):
+        self.base = base
+        self.sensor_names = index["sensor_names"]
+        self._columns = {name: i for i, name in enumerate(self.sensor_names)}
+        version = self.version_path(base, index["source"])
+        self.data = np.load(self._path(version, ".npy"), mmap_mode="r")
+        self.time = np.load(self._path(version, ".time.npy"), mmap_mode="r")
+
+    def __contains__(self, sensor_name: str) -> bool:
+        return sensor_name in self._columns
+
+    def get_data(self, sensor_name: str) -> np.ndarray:
+        """Return the timeseries of a sensor as a read-only view of the memory map"""
+        return self.data[self._columns[sensor_name]]
+
+    def get_block(self, sensor_names: list[str], start: int = None, stop: int = None) -> np.ndarray:
+        """Return the samples start:stop of the sensors as a (time x sensors) array"""
+        rows = [self._columns[name] for name in sensor_names]
+        return self.data[rows, start:stop].T
+
+    @staticmethod
+    def _path(base: Path, suffix: str) -> Path:
+        return base.parent / (base.name + suffix)
+
+    @staticmethod
+    def base_path(filepath: Path) -> Path:
+        """Return the path of the cache files of a file, without suffix"""
+        filepath = Path(filepath).resolve()
+        digest = hashlib.sha1(str(filepath).encode()).hexdigest()[:16]
+        return cache_directory() / f"{filepath.stem}-{digest}"
+
+    @staticmethod
+    def version_path(base: Path, key: dict) -> Path:
+        """Return the path of the arrays of a version of the cache, without suffix"""
+        digest = hashlib.sha1(json.dumps(key, sort_keys=True).encode()).hexdigest()[:16]
+        return base.parent / f"{base.name}-{digest}"
+
+    @classmethod
+    def open(cls, filepath: Path, key: dict) -> "TimeseriesCache":
+        """Return the cache of a file, or None if it is not cached or its source files changed"""
+        base = cls.base_path(filepath)
+        try:
+            with open(cls._path(base, ".json"), "r") as f:
+                index = json.load(f)
+            if index["source"] != key:
+                return None
+            return cls(base, index)
+        except (OSError, ValueError, KeyError):
+            return None
+
+    @classmethod
+    def build(cls, filepath: Path, key: dict, time: np.ndarray, sensor_names: list[str], read) -> "TimeseriesCache":
+        """Write the cache of a file from its time vector and read(sensor_name) for each sensor, one sensor at a time
+
+        The files are written under temporary names and the index last, so a partially written cache is never opened.
+        """
+        base = cls.base_path(filepath)
+        version = cls.version_path(base, key)
+        suffix = f".{os.getpid()}.tmp"
+        first = np.asarray(read(sensor_names[0])) if sensor_names else np.empty(0, dtype=np.float32)
+        temp_data_path = cls._path(version, suffix + ".npy")
+        data = np.lib.format.open_memmap(temp_data_path, mode="w+", dtype=first.dtype, shape=(len(sensor_names), len(time)))
+        for i, name in enumerate(sensor_names):
+            data[i] = first if i == 0 else read(name)
+        data.flush()
+        del data
+        cls._replace(temp_data_path, cls._path(version, ".npy"))
+
+        temp_time_path = cls._path(version, suffix + ".time.npy")
+        np.save(temp_time_path, np.asarray(time, dtype=float))
+        cls._replace(temp_time_path, cls._path(version, ".time.npy"))
+
+        index = {"filepath": str(filepath), "source": key, "sensor_names": list(sensor_names)}
+        temp_index_path = cls._path(base, suffix + ".json")
+        with open(temp_index_path, "w") as f:
+            json.dump(index, f)
+        os.replace(temp_index_path, cls._path(base, ".json"))
+        cls._remove_old_versions(base, version)
+        return cls(base, index)
+
+    @staticmethod
+    def _replace(temp_path: Path, path: Path):
+        """Move a written file to its name, keeping the file of another process that built the same version first"""
+        try:
+            os.replace(temp_path, path)
+        except OSError:
+            if not path.exists():
+                raise
+            os.remove(temp_path)
+
+    @classmethod
+    def _remove_old_versions(cls, base: Path, version: Path):
+        """Remove the arrays of other versions of a cache, except those still memory-mapped by another process"""
+        for path in base.parent.glob(glob.escape(base.name) + "-*.npy"):
+            if path.name.startswith(version.name + ".") or ".tmp" in path.suffixes:
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                pass
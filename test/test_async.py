@@ -0,0 +1,57 @@
+import asyncio
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from loadex import DataSet
+from loadex.formats.parquet_file import ParquetFile
+
+
+def make_dataset(directory,n_files=4):
+    rng=np.random.default_rng(0)
+    for i in range(n_files):
+        pd.DataFrame({"time":np.arange(1000)*0.05,"s1":rng.normal(size=1000).cumsum(),"s2":rng.normal(size=1000).cumsum()}).to_parquet(directory / f"run{i}.parquet")
+    ds=DataSet("test")
+    ds.find_files([str(directory)],format=ParquetFile)
+    ds.set_sensors()
+    ds.sensorlist.get_sensors("s").add_rainflow_statistics([4])
+    return ds
+
+
+async def run_job(create_job):
+    job=create_job()
+    events=[progress async for progress in job]
+    return events,await job
+
+
+def test_generate_statistics_async(tmp_path):
+    ds=make_dataset(tmp_path)
+    callback_events=[]
+    events,failed=asyncio.run(run_job(lambda: ds.generate_statistics_async(parallel=False,progress_callback=callback_events.append)))
+
+    # one copy of the progress per file, and the callback passed to the job is still called
+    assert failed==[]
+    assert [progress.done for progress in events]==[1,2,3,4]
+    assert all(progress.total==4 and progress.success for progress in events)
+    assert len(callback_events)==4
+
+    expected=make_dataset(tmp_path)
+    expected.generate_statistics(parallel=False)
+    pd.testing.assert_frame_equal(ds.to_dataframe(),expected.to_dataframe())
+
+
+def test_from_sql_async(tmp_path):
+    ds=make_dataset(tmp_path)
+    ds.generate_statistics(parallel=False)
+    ds.to_sql(str(tmp_path / "test.db"))
+
+    events,ds_reload=asyncio.run(run_job(lambda: DataSet.from_sql_async(str(tmp_path / "test.db"))))
+    assert [progress.filepath for progress in events]==["designloadcases","files","sensors"]
+    assert ds_reload.n_files==ds.n_files
+    assert ds_reload.sensorlist.names==ds.sensorlist.names
+
+
+def test_from_sql_async_missing_database(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        asyncio.run(run_job(lambda: DataSet.from_sql_async(str(tmp_path / "missing.db"))))
@@ -2,6 +2,7 @@
 from pathlib import Path
 
 import numpy as np
+import pytest
 
 from loadex.formats.bladed_out_file import BladedOutFile
 from loadex import DataSet
@@ -108,4 +109,186 @@ def test_merge_dataset():
     sens=ds.sensorlist.get_sensors("Tower Mx")[0]
     assert sens_join.name==sens.name
     assert sens_join.data.shape==sens.data.shape
-    assert np.allclose(sens_join.data["mean"].sort_index().values, sens.data["mean"].sort_index().values, rtol=1e-5)
\ No newline at end of file
+    assert np.allclose(sens_join.data["mean"].sort_index().values, sens.data["mean"].sort_index().values, rtol=1e-5)
+
+def test_equivalent_load_1hz_counts_hours_of_nan_dels(tmp_path):
+    import pandas as pd
+    from loadex.formats.parquet_file import ParquetFile
+
+    rng=np.random.default_rng(0)
+    for i in range(3):
+        pd.DataFrame({"time":np.arange(2000)*0.05,"s1":rng.normal(size=2000).cumsum(),"s2":rng.normal(size=2000).cumsum()}).to_parquet(tmp_path / f"run{i}.parquet")
+
+    ds=DataSet("test")
+    ds.find_files([str(tmp_path)],format=ParquetFile)
+    ds.set_sensors()
+    ds.sensorlist.get_sensors("s").add_rainflow_statistics([4])
+    ds.generate_statistics()
+    hours=pd.Series([1.0,2.0,3.0],index=ds.filelist.filepaths)
+    ds.filelist.set_hours(hours)
+
+    # a file without a DEL for one sensor still counts towards the hours of the 1Hz equivalent load
+    sensor=ds.sensorlist.get_sensor("s1")
+    sensor.data.loc[sensor.data.index[0],"DEL1Hz_m4"]=np.nan
+    DEL=sensor.data["DEL1Hz_m4"]
+    expected=((DEL**4*hours.reindex(DEL.index)).sum()/hours.sum())**(1/4)
+
+    result=ds.equivalent_load(["s1","s2"],4,Nref="1Hz")
+    assert np.isclose(result.loc["s1","equivalent_load"],expected)
+
+
+def test_merge_databases_of_shards(tmp_path):
+    import pandas as pd
+    from loadex.data.database import merge_databases
+    from loadex.formats.parquet_file import ParquetFile
+
+    run_directory=tmp_path / "runs"
+    run_directory.mkdir()
+    rng=np.random.default_rng(0)
+    for i in range(6):
+        pd.DataFrame({"time":np.arange(1000)*0.05,"s1":rng.normal(size=1000).cumsum(),"s2":rng.normal(size=1000).cumsum()}).to_parquet(run_directory / f"run{i}.parquet")
+
+    def dataset_to_sql(pattern,database_file):
+        ds=DataSet("test")
+        ds.find_files([str(run_directory)],pattern=pattern,format=ParquetFile)
+        ds.set_sensors()
+        ds.sensorlist.get_sensors("s").add_rainflow_statistics([4])
+        ds.generate_statistics(parallel=False)
+        dlc=ds.add_dlc("production",psf=1.35,type="Fatigue")
+        ds.filelist.set_dlc(dlc)
+        ds.to_sql(str(database_file))
+
+    def read_sorted(database_file):
+        # file ids depend on the order of insertion
+        df=DataSet.from_sql(str(database_file)).to_dataframe().drop(columns=[("filelist","id"),("filelist","database_file_id")])
+        return df.sort_index().sort_index(axis=1)
+
+    dataset_to_sql("*.parquet",tmp_path / "single.db")
+    shards=[tmp_path / f"shard{i}.db" for i in range(3)]
+    for i,shard in enumerate(shards):
+        dataset_to_sql(f"run[{2*i}{2*i+1}].parquet",shard)
+
+    merged=tmp_path / "merged.db"
+    merge_databases(merged,shards)
+    expected=read_sorted(tmp_path / "single.db")
+    pd.testing.assert_frame_equal(read_sorted(merged),expected)
+
+    # re-merging a shard replaces its files instead of duplicating them
+    merge_databases(merged,shards[1:2])
+    pd.testing.assert_frame_equal(read_sorted(merged),expected)
+
+
+def extreme_load_by_group(sensor,filelist,characteristic,absmax):
+    """The extreme loads of one sensor averaged with DesignLoadCase.apply_averaging per group, as before the grouped pass"""
+    import pandas as pd
+    from loadex.classes.designloadcases import DesignLoadCase
+
+    df=filelist.to_dataframe().loc[:,["dlc","group","averaging_method","partial_safety_factor"]]
+    if characteristic:
+        df["partial_safety_factor"]=1.0
+    df=pd.concat([df,sensor.data],axis=1)
+    df["absmax"]=df[["min","max"]].abs().max(axis=1)
+
+    extremes=[("mean_of_max","max","idxmax"),("mean_of_min","min","idxmin")]+([("mean_of_absmax","absmax","idxmax")] if absmax else [])
+    rows=[]
+    for extreme,column,select in extremes:
+        averaged=df.groupby(["dlc","group"]).apply(lambda x: pd.Series({
+            "partial_safety_factor":x["partial_safety_factor"].iloc[0],
+            "value":DesignLoadCase.apply_averaging(x[column]*x["partial_safety_factor"],x["averaging_method"])})).reset_index()
+        row=averaged.loc[getattr(averaged["value"],select)(),:]
+        row["extreme"]=extreme
+        rows.append(row)
+    extremes=pd.DataFrame(rows).reset_index(drop=True)
+    extremes["sensor"]=sensor.name
+    return extremes.set_index("sensor")[["extreme","dlc","group","partial_safety_factor","value"]]
+
+
+def test_extreme_load_matches_averaging_per_group(tmp_path):
+    import pandas as pd
+    from loadex.formats.parquet_file import ParquetFile
+
+    rng=np.random.default_rng(0)
+    for i in range(12):
+        pd.DataFrame({"time":np.arange(200)*0.05,"s1":rng.normal(size=200),"s2":rng.normal(size=200),"s3":rng.normal(size=200)}).to_parquet(tmp_path / f"run{i:02d}.parquet")
+
+    ds=DataSet("test")
+    ds.find_files([str(tmp_path)],format=ParquetFile)
+    ds.set_sensors()
+    ds.generate_statistics(parallel=False)
+
+    # a MeanOfMax and a MeanHalf DLC with different safety factors, two groups each
+    filepaths=ds.filelist.filepaths
+    for name,psf,averaging_method,files in [("production",1.35,"MeanOfMax",ds.filelist[:6]),("parked",1.1,"MeanHalf",ds.filelist[6:])]:
+        dlc=ds.add_dlc(name,psf=psf,type="Ultimate")
+        dlc.averaging_method=averaging_method
+        for file in files:
+            file.dlc=dlc
+    ds.filelist.set_groups(pd.Series([f"group{i//3}" for i in range(12)],index=filepaths))
+
+    # s2 is negative in all files, so its largest max and smallest min have the same sign; s3 has the same max and
+    # min in both production groups, so the first group in order is taken
+    s2=ds.sensorlist.get_sensor("s2")
+    s2.data["max"]=-np.abs(s2.data["max"])-1
+    s2.data["min"]=s2.data["max"]-1
+    s3=ds.sensorlist.get_sensor("s3")
+    s3.data["max"]=[2.0]*6+[1.0]*6
+    s3.data["min"]=-3.0
+
+    for characteristic in [False,True]:
+        expected=pd.concat([extreme_load_by_group(sensor,ds.filelist,characteristic,absmax=True) for sensor in ds.sensorlist])
+        result=ds.extreme_load(ds.sensorlist.names,characteristic=characteristic)
+        pd.testing.assert_frame_equal(result,expected,check_dtype=False)
+
+
+def test_ingest_matches_statistics_and_markov(tmp_path):
+    import pandas as pd
+    from loadex.formats.parquet_file import ParquetFile
+
+    rng=np.random.default_rng(0)
+    for i in range(5):
+        pd.DataFrame({"time":np.arange(2000)*0.05,"s1":rng.normal(size=2000).cumsum(),"s2":rng.normal(size=2000).cumsum()}).to_parquet(tmp_path / f"run{i}.parquet")
+
+    def dataset():
+        ds=DataSet("test")
+        ds.find_files([str(tmp_path)],format=ParquetFile)
+        ds.set_sensors()
+        ds.sensorlist.get_sensors("s").add_rainflow_statistics([4])
+        return ds
+
+    separate=dataset()
+    separate.generate_statistics(parallel=False)
+    separate.generate_markov(separate.sensorlist.get_sensors(has_cycle_statistic=True),parallel=False,write_to_file=False)
+
+    # a batch size of a few rows inserts the results of the files in several batches
+    ingested=dataset()
+    ingested.ingest(parallel=False,write_to_file=False,batch_size=2)
+
+    pd.testing.assert_frame_equal(ingested.to_dataframe(),separate.to_dataframe())
+    for sensor in separate.sensorlist.get_sensors(has_cycle_statistic=True):
+        assert not sensor.markovcycles.empty
+        pd.testing.assert_frame_equal(ingested.sensorlist.get_sensor(sensor.name).markovcycles,sensor.markovcycles)
+
+
+@pytest.mark.parametrize("sensor_executor",[None,"thread","process"])
+def test_sensor_workers_match_single_worker(tmp_path,sensor_executor):
+    import pandas as pd
+    from loadex.formats.parquet_file import ParquetFile
+
+    rng=np.random.default_rng(0)
+    for i in range(2):
+        pd.DataFrame({"time":np.arange(2000)*0.05,**{f"s{j}":rng.normal(size=2000).cumsum() for j in range(5)}}).to_parquet(tmp_path / f"run{i}.parquet")
+
+    def ingest(**kwargs):
+        ds=DataSet("test")
+        ds.find_files([str(tmp_path)],format=ParquetFile)
+        ds.set_sensors()
+        ds.sensorlist.get_sensors("s").add_rainflow_statistics([4])
+        ds.ingest(parallel=False,write_to_file=False,**kwargs)
+        return ds
+
+    expected=ingest()
+    # the groups of sensors of each file are spread over the workers
+    result=ingest(sensor_workers=3,sensor_executor=sensor_executor)
+    pd.testing.assert_frame_equal(result.to_dataframe(),expected.to_dataframe())
+    for sensor in expected.sensorlist.get_sensors(has_cycle_statistic=True):
+        pd.testing.assert_frame_equal(result.sensorlist.get_sensor(sensor.name).markovcycles,sensor.markovcycles)
@@ -0,0 +1,105 @@
+import os
+import threading
+import time
+from pathlib import Path
+
+from loadex.classes.executors import ProcessExecutor, ThreadExecutor
+from loadex.classes.filelist import File
+
+
+class FaultyFile(File):
+    """A file whose task hangs, crashes its worker or raises depending on its name, importable by spawn workers"""
+
+    def run(self):
+        name=self.filepath.stem
+        if name.startswith("hang_once"):
+            # hangs on the first attempt only
+            flag=self.filepath.with_suffix(".started")
+            if not flag.exists():
+                flag.write_text("")
+                time.sleep(60)
+        elif name.startswith("hang"):
+            time.sleep(60)
+        elif name.startswith("crash"):
+            os._exit(1)
+        elif name.startswith("raise"):
+            raise ValueError(name)
+        return os.getpid()
+
+
+class ProcessOnlyFile(File):
+    """A file of a format that must not be read from several threads"""
+
+    sensor_executor="process"
+
+    def run(self):
+        return threading.get_ident()
+
+
+def run_files(executor,filepaths,file_type=FaultyFile):
+    files=[file_type(filepath) for filepath in filepaths]
+    results={}
+    for index,output,metadata,seconds,failure in executor.map_files(files,"run",(),{}):
+        results[files[index].filepath.stem]=(output,failure)
+    assert len(results)==len(files)
+    return results
+
+
+def test_process_executor_isolates_failures(tmp_path):
+    names=["good0","hang","crash","raise","good1"]
+    executor=ProcessExecutor(workers=2,timeout=10)
+    results=run_files(executor,[tmp_path / name for name in names])
+
+    for name in ["good0","good1"]:
+        output,failure=results[name]
+        assert failure is None
+        assert isinstance(output,int)
+
+    for name,reason in [("hang","timeout"),("crash","crashed"),("raise","error")]:
+        output,failure=results[name]
+        assert output==(False,)
+        assert failure.reason==reason
+        assert failure.attempts==1
+        assert Path(failure.filepath).stem==name
+
+
+def test_process_executor_retries(tmp_path):
+    executor=ProcessExecutor(workers=2,timeout=10,retries=1)
+    results=run_files(executor,[tmp_path / "hang_once",tmp_path / "crash",tmp_path / "good"])
+
+    # a file that hangs once succeeds on its retry, one that always crashes fails after both attempts
+    assert results["hang_once"][1] is None
+    assert results["good"][1] is None
+    failure=results["crash"][1]
+    assert failure.reason=="crashed"
+    assert failure.attempts==2
+
+
+def test_process_executor_max_tasks_per_child(tmp_path):
+    executor=ProcessExecutor(workers=1,max_tasks_per_child=1)
+    results=run_files(executor,[tmp_path / f"good{i}" for i in range(3)])
+
+    # each file runs in a new worker
+    pids={output for output,failure in results.values()}
+    assert len(pids)==3
+
+
+def test_process_executor_keeps_pool_in_with_block(tmp_path):
+    executor=ProcessExecutor(workers=1)
+    with executor:
+        first=run_files(executor,[tmp_path / "good0"])
+        second=run_files(executor,[tmp_path / "good1"])
+        # a crash replaces the pool, which is then kept again
+        run_files(executor,[tmp_path / "crash"])
+        third=run_files(executor,[tmp_path / "good2"])
+        fourth=run_files(executor,[tmp_path / "good3"])
+    assert executor._pool is None
+
+    assert first["good0"][0]==second["good1"][0]
+    assert third["good2"][0]==fourth["good3"][0]
+    assert third["good2"][0]!=first["good0"][0]
+
+
+def test_thread_executor_runs_process_only_formats_serially(tmp_path):
+    results=run_files(ThreadExecutor(workers=4),[tmp_path / f"good{i}" for i in range(4)],ProcessOnlyFile)
+    assert {output for output,failure in results.values()}=={threading.get_ident()}
@@ -0,0 +1,52 @@
+from pathlib import Path
+import weakref
+
+from loadex.formats import header_index
+from loadex.formats.bladed_out_file import BladedOutFile
+
+
+current_directory=Path(__file__).parent
+data_directory = current_directory / "data" / "Bladed"
+
+
+def test_runs_with_same_layout_share_index_entry(tmp_path):
+    header_index.enable(tmp_path)
+    try:
+        # idling and parked differ in their FILE, CONTENT and ULOADS records only
+        sensor_names=[BladedOutFile(data_directory / f"{name}.$PJ").sensor_names for name in ["idling","parked"]]
+        assert len(list(tmp_path.glob("*.json")))==1
+        assert sensor_names[0]==sensor_names[1]
+
+        # sensors built from the index
+        assert BladedOutFile(data_directory / "parked.$PJ").sensor_names==sensor_names[1]
+    finally:
+        header_index.disable()
+
+
+def test_sensors_do_not_keep_file_alive():
+    file=BladedOutFile(data_directory / "idling.$PJ")
+    sensors=file.sensors
+    assert len(sensors)>0
+
+    reference=weakref.ref(file)
+    del file
+    assert reference() is None
+
+
+def test_layout_key_includes_axis_values_of_axes_other_than_time(tmp_path):
+    header=(data_directory / "idling.%41").read_bytes()
+    distance_axis=b"AXIMETH\t3\nAXIVAL\t0.0000000"
+    time_axis=b"MIN \t0.0000000E+00"
+    assert distance_axis in header and time_axis in header
+
+    def key(content):
+        path=tmp_path / "run.%41"
+        path.write_bytes(content)
+        return header_index.layout_key(tmp_path / "run.$PJ",[path])
+
+    # the start of the time axis is not part of the layout
+    assert key(header)==key(header.replace(time_axis,b"MIN \t1.0000000E+01"))
+
+    # the start and step of another axis are
+    stations=[distance_axis.replace(b"AXIVAL\t0.0000000",f"MIN \t{start}\nSTEP\t1.0".encode()) for start in [0.0,0.5]]
+    assert key(header.replace(distance_axis,stations[0]))!=key(header.replace(distance_axis,stations[1]))
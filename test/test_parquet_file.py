@@ -0,0 +1,61 @@
+import numpy as np
+import pandas as pd
+
+from loadex.formats.parquet_file import ParquetFile
+
+
+def write_run(filepath,n=1000):
+    rng=np.random.default_rng(0)
+    df=pd.DataFrame({"time":np.arange(n)*0.05,"s1":rng.normal(size=n),"s2":rng.normal(size=n),"s3":rng.normal(size=n)},
+                    index=pd.Index(np.arange(n),name="sample"))
+    df.to_parquet(filepath,row_group_size=100)
+    return df
+
+
+def test_parquet_sensor_names_from_schema(tmp_path):
+    write_run(tmp_path / "run.parquet")
+    file=ParquetFile(tmp_path / "run.parquet")
+
+    # the stored index is not a sensor, and no column is read to list the sensors
+    assert file.sensor_names==["time","s1","s2","s3"]
+    assert len(file._columns)==0
+
+
+def test_parquet_column_cache(tmp_path):
+    df=write_run(tmp_path / "run.parquet")
+    file=ParquetFile(tmp_path / "run.parquet")
+    file.column_cache_size=2
+
+    s1=file.get_data("s1")
+    file.get_data("s2")
+    assert file.get_data("s1") is s1
+    file.get_data("s3")
+
+    # the least recently read column is dropped
+    assert list(file._columns)==["s1","s3"]
+    assert np.array_equal(file.get_data("s2").to_numpy(),df["s2"].to_numpy())
+
+
+def test_parquet_time_range(tmp_path):
+    df=write_run(tmp_path / "run.parquet")
+    time_range=(12.32,27.0)
+    in_range=(df["time"]>=time_range[0]) & (df["time"]<=time_range[1])
+
+    # columns not read yet are filtered by row group when read
+    filtered=ParquetFile(tmp_path / "run.parquet")
+    filtered_time=filtered.get_time(time_range)
+    filtered_data=filtered.get_data("s1",time_range)
+    assert len(filtered._columns)==0
+
+    # columns already read are sliced
+    cached=ParquetFile(tmp_path / "run.parquet")
+    cached.get_time()
+    cached.get_data("s1")
+    cached_time=cached.get_time(time_range)
+    cached_data=cached.get_data("s1",time_range)
+
+    for time,data in [(filtered_time,filtered_data),(cached_time,cached_data)]:
+        assert np.array_equal(time.to_numpy(),df["time"][in_range].to_numpy())
+        assert np.array_equal(data.to_numpy(),df["s1"][in_range].to_numpy())
+        assert time.index[0]==0
+    pd.testing.assert_series_equal(filtered_data,cached_data)
@@ -0,0 +1,110 @@
+import numpy as np
+import pandas as pd
+
+from loadex.classes import statistics
+
+
+def test_batch_statistics_match_series():
+    rng=np.random.default_rng(0)
+    block=rng.normal(size=(1000,4)).cumsum(axis=0)
+    block[10,2]=np.nan
+    t=pd.Series(np.arange(len(block))*0.05)
+
+    for stat in statistics.standard_statistics+[statistics.EquivalentLoad(4)]:
+        values=stat.batch_aggregation_function(block,t)
+        for j in range(block.shape[1]):
+            if stat.uses_cycles and j==2:
+                continue # rainflow counting of NaN is undefined
+            assert np.isclose(values[j], stat.aggregation_function(pd.Series(block[:,j]),t))
+
+
+def test_equivalent_load_from_cycles():
+    rng=np.random.default_rng(1)
+    x=pd.Series(rng.normal(size=2000).cumsum())
+    t=pd.Series(np.arange(len(x))*0.05)
+
+    cycles=statistics.extract_cycles(x)
+    for m in [3,4,5,9,10]:
+        stat=statistics.EquivalentLoad(m)
+        assert np.isclose(stat.cycle_aggregation_function(cycles,t), stat.aggregation_function(x,t))
+
+
+def test_numpy_cycle_counting_matches_rainflow():
+    from loadex.classes import cyclecounting
+
+    def sort_cycles(cycles):
+        return cycles[np.lexsort(cycles.T[::-1])]
+
+    rng=np.random.default_rng(2)
+    block=np.round(rng.normal(size=(500,6)).cumsum(axis=0),1)
+    block[:100,0]=1.0
+
+    batch=cyclecounting.extract_cycles_batch(block, backend="numpy")
+    for j in range(block.shape[1]):
+        expected=sort_cycles(cyclecounting.extract_cycles(block[:,j], backend="rainflow"))
+        assert np.allclose(sort_cycles(batch[j]), expected)
+        assert np.allclose(sort_cycles(cyclecounting.extract_cycles(block[:,j], backend="numpy")), expected)
+
+
+def test_accumulators_match_batch():
+    rng=np.random.default_rng(3)
+    block=rng.normal(size=(1000,4)).cumsum(axis=0)
+    block[10,2]=np.nan
+    block[:,3]=np.nan
+    t=pd.Series(np.arange(len(block))*0.05)
+
+    for stat in statistics.standard_statistics:
+        accumulator=stat.accumulator(block.shape[1])
+        for start in range(0,len(block),97):
+            accumulator.update(block[start:start+97])
+        assert np.allclose(accumulator.result(), stat.batch_aggregation_function(block,t), equal_nan=True)
+
+
+def test_streaming_cycle_counting_matches_batch():
+    from loadex.classes import cyclecounting
+
+    def sort_cycles(cycles):
+        return cycles[np.lexsort(cycles.T[::-1])]
+
+    rng=np.random.default_rng(4)
+    block=np.round(rng.normal(size=(500,3)).cumsum(axis=0),0)
+
+    for chunk_size in [1,2,13,500]:
+        counter=cyclecounting.StreamingCycleCounter(block.shape[1])
+        for start in range(0,len(block),chunk_size):
+            counter.update(block[start:start+chunk_size])
+        for streamed, expected in zip(counter.finalize(), cyclecounting.extract_cycles_batch(block)):
+            assert np.allclose(sort_cycles(streamed), sort_cycles(expected))
+
+
+def test_equivalent_load_from_markov_cycles():
+    from loadex.classes.sensorlist import Sensor
+
+    rng=np.random.default_rng(5)
+    t=pd.Series(np.arange(2000)*0.05)
+    sensor=Sensor("x")
+    expected={}
+    for filename in ["run0","run1"]:
+        cycles=statistics.extract_cycles(rng.normal(size=len(t)).cumsum())
+        markov=pd.DataFrame(cycles,columns=["range","mean","count"],index=pd.Index([filename]*len(cycles),name="filename"))
+        markov["simulation_duration"]=max(t)-min(t)
+        sensor._insert_generated_markov(markov)
+        expected[filename]=cycles
+
+    for m in [3,4.5,10]:
+        Leq=sensor.equivalent_load_from_cycles(m)
+        for filename, cycles in expected.items():
+            assert np.isclose(Leq[filename], statistics.equivalent_load_from_cycles(cycles,t,m))
+
+
+def test_cycle_counting_backend_reaches_spawn_workers():
+    import concurrent.futures
+    import multiprocessing
+    from loadex.classes import cyclecounting
+
+    try:
+        cyclecounting.set_backend("rainflow")
+        with concurrent.futures.ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+            assert pool.submit(cyclecounting.get_backend).result()=="rainflow"
+    finally:
+        cyclecounting.set_backend(cyclecounting.default_backend)
@@ -0,0 +1,65 @@
+import os
+
+import numpy as np
+import pytest
+
+from loadex.formats import timeseries_cache
+from loadex.formats.timeseries_cache import TimeseriesCache, source_key
+
+
+@pytest.fixture
+def cache_directory(tmp_path):
+    timeseries_cache.enable(tmp_path / "cache")
+    yield tmp_path / "cache"
+    timeseries_cache.disable()
+
+
+def build(source,data):
+    reads=[]
+    def read(name):
+        reads.append(name)
+        return data[name]
+    cache=TimeseriesCache.build(source,source_key([source]),np.arange(100)*0.1,list(data),read)
+    return cache,reads
+
+
+def test_build_and_open_memory_map(tmp_path,cache_directory):
+    source=tmp_path / "run.$TE"
+    source.write_text("run")
+    rng=np.random.default_rng(0)
+    data={name: rng.normal(size=100).astype(np.float32) for name in ["a","b","c"]}
+
+    # each sensor is read once
+    _,reads=build(source,data)
+    assert reads==["a","b","c"]
+
+    cache=TimeseriesCache.open(source,source_key([source]))
+    assert isinstance(cache.data,np.memmap)
+    assert cache.sensor_names==["a","b","c"]
+    assert "b" in cache and "d" not in cache
+    assert np.array_equal(cache.get_data("b"),data["b"])
+    assert np.array_equal(cache.get_block(["c","a"],10,20),np.column_stack([data["c"][10:20],data["a"][10:20]]))
+    assert np.allclose(cache.time,np.arange(100)*0.1)
+
+
+def test_changed_source_invalidates_cache(tmp_path,cache_directory):
+    source=tmp_path / "run.$TE"
+    source.write_text("run")
+    old_key=source_key([source])
+    build(source,{"a":np.zeros(100)})
+    old_version=TimeseriesCache.version_path(TimeseriesCache.base_path(source),old_key)
+
+    # a source file of another size or modification time is not read from the cache
+    source.write_text("run again")
+    os.utime(source,ns=(old_key["mtime_ns"]+10**9,old_key["mtime_ns"]+10**9))
+    key=source_key([source])
+    assert key!=old_key
+    assert TimeseriesCache.open(source,key) is None
+
+    # the rebuilt cache is a new version, and the arrays of the old one are removed
+    build(source,{"a":np.ones(100)})
+    cache=TimeseriesCache.open(source,key)
+    assert np.array_equal(cache.get_data("a"),np.ones(100))
+    assert TimeseriesCache.open(source,old_key) is None
+    assert not (cache_directory / (old_version.name + ".npy")).exists()
+    assert len(list(cache_directory.glob("*.npy")))==2